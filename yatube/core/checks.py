@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """Без общего кэша процессы не видят сброс версий страниц друг
+    друга."""
+    if settings.DEBUG or settings.CACHES['default']['BACKEND'] not in (
+            LOCAL_CACHES):
+        return []
+    return [Warning(
+        'Кэш по умолчанию свой у каждого процесса.',
+        hint='Задайте CACHE_LOCATION: версии страниц и журнал '
+             'автодополнения должны быть общими для всех процессов.',
+        id='core.W001',
+    )]
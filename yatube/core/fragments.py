@@ -0,0 +1,76 @@
+import re
+from urllib.parse import quote, unquote
+
+from django.template.loader import render_to_string
+
+FRAGMENTS = {}
+VOLATILE = set()
+BATCHED = set()
+MARKER = re.compile(r'<!--fragment:([\w:%.~-]+)-->')
+
+
+def fragment(name, volatile=False, batched=False):
+    """Регистрирует функцию, отрисовывающую фрагмент name для запроса.
+
+    Функция получает request и строковые аргументы фрагмента и
+    возвращает HTML. Фрагмент volatile меняется без сдвига версии
+    страницы, поэтому остаётся меткой в любой закэшированной странице.
+    Функция фрагмента batched получает request и список кортежей
+    аргументов всех его меток на странице и возвращает словарь
+    {аргументы: HTML}.
+    """
+    def decorator(func):
+        FRAGMENTS[name] = func
+        if volatile:
+            VOLATILE.add(name)
+        if batched:
+            BATCHED.add(name)
+        return func
+    return decorator
+
+
+def render_fragment(name, request, *args):
+    args = tuple(str(arg) for arg in args)
+    if name in BATCHED:
+        return FRAGMENTS[name](request, [args])[args]
+    return FRAGMENTS[name](request, *args)
+
+
+def marker(name, *args):
+    """Метка на месте фрагмента в общей для всех пользователей странице."""
+    return '<!--fragment:{}-->'.format(
+        ':'.join([name] + [quote(str(arg), safe='') for arg in args]))
+
+
+def parse(match):
+    name, *args = match.group(1).split(':')
+    return name, tuple(map(unquote, args))
+
+
+def fill(content, request):
+    """Заменяет метки фрагментов их версией для текущего запроса.
+
+    Метки фрагментов batched отрисовываются одним вызовом на страницу.
+    """
+    calls = {}
+    for match in MARKER.finditer(content):
+        name, args = parse(match)
+        if name in BATCHED:
+            calls.setdefault(name, {})[args] = None
+    rendered = {
+        (name, args): html
+        for name, args_list in calls.items()
+        for args, html in FRAGMENTS[name](request, list(args_list)).items()
+    }
+
+    def replace(match):
+        name, args = parse(match)
+        if (name, args) in rendered:
+            return rendered[name, args]
+        return render_fragment(name, request, *args)
+    return MARKER.sub(replace, content)
+
+
+@fragment('header')
+def header(request):
+    return render_to_string('includes/header.html', request=request)
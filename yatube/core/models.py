@@ -10,3 +10,29 @@ class CreatedModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class CountersModel(models.Model):
+    """Абстрактная модель с денормализованными счётчиками.
+
+    Счётчики меняются только атомарными UPDATE с F(), поэтому обычное
+    сохранение уже существующего объекта их не перезаписывает.
+    """
+    counter_fields = ()
+
+    def save(self, *args, **kwargs):
+        if (
+                self.counter_fields
+                and not self._state.adding
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')
+        ):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.counter_fields
+            ]
+        return super().save(*args, **kwargs)
+
+    class Meta:
+        abstract = True
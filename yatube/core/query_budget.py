@@ -0,0 +1,108 @@
+import logging
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDERS = re.compile(r'%s(?:\s*,\s*%s)+')
+SELECT = re.compile(r'^\s*SELECT\b', re.IGNORECASE)
+
+_state = threading.local()
+
+
+class QueryBudgetExceeded(Exception):
+    """View выполнила больше запросов, чем заявлено, или попала в N+1."""
+
+
+def query_budget(max_queries):
+    """Объявляет максимальное число SQL-запросов на один запрос к view.
+
+    Проверку выполняет core.query_budget.QueryBudgetMiddleware.
+    """
+    def decorator(view_func):
+        view_func.query_budget = max_queries
+        return view_func
+    return decorator
+
+
+@contextmanager
+def not_counted():
+    """Запросы внутри блока не входят в бюджет view.
+
+    Для фоновой работы, которая выполняется в потоке запроса (например,
+    после коммита в режиме отладки).
+    """
+    previous = getattr(_state, 'paused', False)
+    _state.paused = True
+    try:
+        yield
+    finally:
+        _state.paused = previous
+
+
+class QueryRecorder:
+    """Обёртка execute_wrapper, запоминающая форму каждого запроса."""
+
+    def __init__(self):
+        self.shapes = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not getattr(_state, 'paused', False):
+            self.shapes.append(PLACEHOLDERS.sub('%s', sql))
+        return execute(sql, params, many, context)
+
+    def problems(self, budget):
+        problems = []
+        if len(self.shapes) > budget:
+            problems.append(
+                f'{len(self.shapes)} запросов при бюджете {budget}')
+        selects = Counter(
+            shape for shape in self.shapes if SELECT.match(shape))
+        for shape, count in selects.most_common():
+            if count <= settings.QUERY_BUDGET_MAX_REPEATS:
+                break
+            problems.append(f'{count} одинаковых запросов (N+1): {shape}')
+        return problems
+
+
+class QueryBudgetMiddleware:
+    """Считает запросы к БД для view с объявленным бюджетом.
+
+    Учитываются все запросы обработки, включая сессию и пользователя.
+    При превышении бюджета или повторе одного и того же SELECT больше
+    settings.QUERY_BUDGET_MAX_REPEATS раз бросает QueryBudgetExceeded,
+    если включён settings.QUERY_BUDGET_RAISE (тесты), иначе пишет
+    предупреждение в лог.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        budget = getattr(request, 'query_budget', None)
+        if budget is not None:
+            self.check(request, recorder, budget)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.query_budget = getattr(view_func, 'query_budget', None)
+        request.query_budget_view = getattr(
+            view_func, '__qualname__', repr(view_func))
+
+    def check(self, request, recorder, budget):
+        problems = recorder.problems(budget)
+        if not problems:
+            return
+        message = '{} {}: {}'.format(
+            request.query_budget_view, request.path, '; '.join(problems))
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
@@ -0,0 +1,22 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.fragments import VOLATILE, marker, render_fragment
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def fragment(context, name, *args):
+    """Выводит фрагмент, зависящий от пользователя или часто меняющийся.
+
+    При кэшировании общей для всех страницы (request.shared_page) вместо
+    фрагмента выводится метка, которая заполняется уже после чтения
+    страницы из кэша. Метка фрагмента volatile выводится в любой
+    кэшируемой странице (request.cached_page).
+    """
+    request = context['request']
+    if getattr(request, 'shared_page', False) or (
+            name in VOLATILE and getattr(request, 'cached_page', False)):
+        return mark_safe(marker(name, *args))
+    return mark_safe(render_fragment(name, request, *args))
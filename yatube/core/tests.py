@@ -1,6 +1,13 @@
+import os
+import shutil
+import tempfile
+from urllib.parse import quote
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
+
+from .checks import shared_cache_check
 
 User = get_user_model()
 
@@ -17,3 +24,115 @@ class CoreURLTests(TestCase):
         settings.DEBUG = False
         response = self.authorized_client.get('page_404/')
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+class MediaViewTests(TestCase):
+    HASHED = 'posts/ab/cd/{}.txt'.format('0' * 64)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(settings.MEDIA_ROOT, 'posts', 'ab', 'cd'))
+        for path in ('posts/file.txt', cls.HASHED):
+            with open(os.path.join(settings.MEDIA_ROOT, path), 'wb') as file:
+                file.write(b'0123456789')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def get(self, path=HASHED, **headers):
+        return self.client.get(settings.MEDIA_URL + path, **headers)
+
+    def test_serves_file_with_cache_headers(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        response = self.get('posts/file.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        not_modified = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        not_modified = self.get(
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_byte_ranges(self):
+        cases = (
+            ('bytes=2-5', 206, b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=-3', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=20-', 416, b'', 'bytes */10'),
+        )
+        for header, status, content, content_range in cases:
+            with self.subTest(header=header):
+                response = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, status)
+                self.assertEqual(response['Content-Range'], content_range)
+                self.assertEqual(
+                    'immutable' in response.get('Cache-Control', ''),
+                    status == 206)
+                if response.streaming:
+                    self.assertEqual(
+                        b''.join(response.streaming_content), content)
+        response = self.get(HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_head_returns_headers_only(self):
+        response = self.client.head(settings.MEDIA_URL + self.HASHED)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Length'], '10')
+        response = self.client.head(
+            settings.MEDIA_URL + self.HASHED, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Length'], '4')
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_offloads_to_front_server(self):
+        response = self.get('posts/file.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/file.txt')
+        self.assertEqual(response.content, b'')
+
+    @override_settings(MEDIA_SENDFILE_HEADER='X-Accel-Redirect')
+    def test_front_server_path_is_quoted(self):
+        """Пробелы, %, ? и не-ASCII в имени не ломают внутренний
+        редирект nginx."""
+        name = 'posts/мой файл 100%?.txt'
+        with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as file:
+            file.write(b'0123456789')
+        response = self.get(quote(name))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/posts/%D0%BC%D0%BE%D0%B9%20%D1%84%D0%B0%D0%B9'
+            '%D0%BB%20100%25%3F.txt')
+
+    def test_missing_and_outside_files(self):
+        for path in ('posts/missing.txt', '../manage.py', 'posts'):
+            with self.subTest(path=path):
+                self.assertEqual(self.get(path).status_code, 404)
+
+
+class SharedCacheCheckTests(TestCase):
+
+    def test_local_cache_warns_in_production(self):
+        """Без DEBUG локальный кэш процесса даёт предупреждение."""
+        with override_settings(DEBUG=False):
+            self.assertEqual(
+                [warning.id for warning in shared_cache_check(None)],
+                ['core.W001'])
+        memcached = {'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': '127.0.0.1:11211',
+        }}
+        with override_settings(DEBUG=False, CACHES=memcached):
+            self.assertEqual(shared_cache_check(None), [])
@@ -0,0 +1,101 @@
+import warnings
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from PIL import Image
+
+
+class RejectedUpload(UploadedFile):
+    """Пустой файл на месте загрузки сверх settings.UPLOAD_MAX_SIZE.
+
+    Попадает в request.FILES вместо пропущенного поля, поэтому любая
+    форма - и на сайте, и в админке - показывает ошибку, а не молча
+    оставляет прежнюю картинку.
+    """
+    exceeds_limit = True
+
+    def __init__(self, name, content_type, size, charset):
+        super().__init__(
+            BytesIO(), name, content_type, size, charset)
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загружаемый файл во временный файл по частям.
+
+    Как только файл превышает settings.UPLOAD_MAX_SIZE, его части
+    больше не записываются, а временный файл удаляется. Остаток тела
+    запроса дочитывается, чтобы ответ с ошибкой формы дошёл до
+    браузера, а остальные поля формы не потерялись. Не читать
+    огромные тела вообще - дело фронт-сервера (client_max_body_size).
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            if not self.file.closed:
+                self.file.close()
+            return None
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            return RejectedUpload(
+                self.file_name, self.content_type, self.received,
+                self.charset)
+        return super().file_complete(file_size)
+
+
+ERROR_MESSAGES = {
+    'too_large': 'Файл больше %(limit)s МБ.',
+    'format': 'Поддерживаются только %(formats)s.',
+    'too_many_pixels': (
+        'Картинка %(width)s×%(height)s слишком большая, допустимо '
+        'не больше %(limit)s мегапикселей.'),
+    'invalid_image': (
+        'Загрузите правильное изображение. Файл, который вы загрузили, '
+        'поврежден или не является изображением.'),
+}
+
+
+def error(code, **params):
+    return ValidationError(ERROR_MESSAGES[code], code=code, params=params)
+
+
+def check_image_upload(upload):
+    """Проверяет загруженную картинку до её полной обработки формой.
+
+    Остановленная загрузка (RejectedUpload) сразу получает ошибку
+    размера. Формат и размеры в пикселях берутся из заголовка без
+    декодирования растра, поэтому большие файлы и «бомбы» отклоняются
+    до того, как займут память.
+    """
+    limit = settings.UPLOAD_MAX_SIZE
+    if getattr(upload, 'exceeds_limit', False) or upload.size > limit:
+        raise error('too_large', limit=limit // 1024 // 1024)
+    max_pixels = settings.IMAGE_MAX_PIXELS
+    upload.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            image = Image.open(upload)
+    except (Image.DecompressionBombError,
+            Image.DecompressionBombWarning) as exc:
+        raise error('too_many_pixels', width='?', height='?',
+                    limit=max_pixels // 1000000) from exc
+    except Exception as exc:
+        raise error('invalid_image') from exc
+    finally:
+        upload.seek(0)
+    if image.format not in settings.IMAGE_UPLOAD_FORMATS:
+        raise error(
+            'format', formats=', '.join(settings.IMAGE_UPLOAD_FORMATS))
+    if image.width * image.height > max_pixels:
+        raise error('too_many_pixels', width=image.width,
+                    height=image.height, limit=max_pixels // 1000000)
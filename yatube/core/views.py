@@ -1,4 +1,21 @@
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .query_budget import query_budget
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
 
 
 def page_not_found(request, exception):
@@ -11,3 +28,111 @@ def csrf_failure(request, reason=''):
 
 def internal_server_error(request):
     return render(request, 'core/500.html')
+
+
+def parse_range(header, size):
+    """(start, end) включительно для одного диапазона bytes=...,
+    None - отдать файл целиком, ValueError - диапазон вне файла."""
+    match = RANGE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Диапазон вне файла')
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+@query_budget(0)
+def serve_media(request, path):
+    """Отдаёт файл из MEDIA_ROOT с ETag, Range и долгим кэшированием.
+
+    Файл с именем, выведенным из содержимого
+    (settings.MEDIA_IMMUTABLE_PATTERN), по одному адресу не меняется, и
+    его ответы 200 и 206 кэшируются как immutable; остальные файлы
+    клиент проверяет по ETag при каждом обращении. На HEAD тело не
+    читается. При settings.MEDIA_SENDFILE_HEADER тело отдаёт
+    фронт-сервер (X-Accel-Redirect для nginx, X-Sendfile для
+    Apache/lighttpd), а Python только проверяет путь и условные
+    заголовки.
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat_result = os.stat(full_path)
+    except (SuspiciousFileOperation, OSError):
+        raise Http404('Файл не найден')
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise Http404('Файл не найден')
+    size = stat_result.st_size
+    etag = quote_etag(f'{int(stat_result.st_mtime):x}-{size:x}')
+    last_modified = int(stat_result.st_mtime)
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        response = not_modified
+    else:
+        response = file_response(request, full_path, path, size, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if response.status_code not in (200, 206):
+        return response
+    if re.match(settings.MEDIA_IMMUTABLE_PATTERN, path):
+        patch_cache_control(
+            response, public=True, immutable=True,
+            max_age=settings.MEDIA_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def file_response(request, full_path, path, size, etag):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    header = settings.MEDIA_SENDFILE_HEADER
+    if header:
+        response = HttpResponse(content_type=content_type)
+        if header == 'X-Accel-Redirect':
+            response[header] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        else:
+            response[header] = full_path
+        return response
+    byte_range = None
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        try:
+            byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+    start, end = byte_range or (0, size - 1)
+    status = 206 if byte_range else 200
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type, status=status)
+    else:
+        response = StreamingHttpResponse(
+            read_range(full_path, start, end - start + 1),
+            content_type=content_type,
+            status=status,
+        )
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
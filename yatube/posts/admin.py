@@ -1,12 +1,45 @@
 from django.contrib import admin
+from django.db.models import Q
 
-from .models import Comment, Follow, Group, Post
+from .forms import PostAdminForm
+from .models import Comment, Follow, Group, Post, Profile
+from .paginators import EstimatedCountPaginator
+from .search import comment_filter, post_filter
 
 
-class PostAdmin(admin.ModelAdmin):
+class IndexSearchAdmin(admin.ModelAdmin):
+    """Список для таблиц на десятки миллионов строк.
+
+    Поиск идёт по полнотекстовому индексу (index_filter) и точным
+    совпадениям полей exact_search_fields вместо icontains по всей
+    таблице, а число строк оценивается EstimatedCountPaginator без
+    второго COUNT по всей таблице. Без index_filter поиск обычный.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # Условие Q по строке поиска, например search.post_filter.
+    index_filter = None
+    # Поля с индексом, которые сравниваются со строкой поиска целиком.
+    exact_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term or self.index_filter is None:
+            return super().get_search_results(
+                request, queryset, search_term)
+        condition = self.index_filter(search_term)
+        for field in self.exact_search_fields:
+            condition |= Q(**{field: search_term})
+        return queryset.filter(condition), False
+
+
+class PostAdmin(IndexSearchAdmin):
+    form = PostAdminForm
     list_display = ('pk', 'text', 'image', 'pub_date', 'author', 'group')
     list_editable = ('group',)
+    list_select_related = ('author', 'group')
     search_fields = ('text',)
+    index_filter = staticmethod(post_filter)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
@@ -15,11 +48,15 @@ class GroupAdmin(admin.ModelAdmin):
     list_display = ('title', 'slug', 'description')
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(IndexSearchAdmin):
     list_display = ('pk', 'text', 'author', 'created',)
     list_editable = ('text',)
-    search_fields = ('author',)
+    list_select_related = ('author',)
+    search_fields = ('text', 'author__username')
+    index_filter = staticmethod(comment_filter)
+    exact_search_fields = ('author__username',)
     list_filter = ('created',)
+    ordering = ('-pk',)
 
 
 class FollowAdmin(admin.ModelAdmin):
@@ -27,7 +64,14 @@ class FollowAdmin(admin.ModelAdmin):
     search_fields = ('user',)
 
 
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = (
+        'user', 'posts_count', 'followers_count', 'following_count')
+    readonly_fields = ('posts_count', 'followers_count', 'following_count')
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(Profile, ProfileAdmin)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+
+from core.query_budget import query_budget
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .cache import (ALL_PAGES, COMMENT_COUNTS, INDEX_PAGE, get_version,
+                    group_page, post_page, profile_page, user_state)
+from .feed import follow_feed
+from .models import Comment, Group, Post, User, path_depth
+from .paginators import CommentCursorPaginator, CursorPaginator
+from .storage import image_storage
+
+API_VERSION = 'v1'
+
+# Поле ответа -> поле для values(). Экземпляры моделей не создаются.
+POST_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'comments_count': 'comments_count',
+    'last_commenter': 'last_commenter__username',
+}
+COMMENT_FIELDS = {
+    'id': 'pk',
+    'text': 'text',
+    'created': 'created',
+    'author': 'author__username',
+    'parent': 'parent_id',
+    'depth': 'path',
+}
+CONVERTERS = {
+    'image': lambda name: image_storage.url(name) if name else None,
+    'depth': path_depth,
+}
+
+
+def error(status, detail):
+    return JsonResponse({'detail': detail}, status=status)
+
+
+def get_fields(request, spec):
+    """Поля из ?fields=a,b (по умолчанию все); None - неизвестное поле."""
+    requested = request.GET.get('fields')
+    if not requested:
+        return list(spec)
+    fields = [field for field in requested.split(',') if field]
+    if not fields or set(fields) - set(spec):
+        return None
+    return fields
+
+
+def make_etag(*parts):
+    """Сильный ETag из частей, от которых зависит ответ."""
+    raw = json.dumps([API_VERSION, *parts], default=str)
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def serialize(row, fields, spec):
+    result = {}
+    for field in fields:
+        value = row[spec[field]]
+        convert = CONVERTERS.get(field)
+        result[field] = convert(value) if convert else value
+    return result
+
+
+def page_response(request, queryset, paginator_class, per_page, spec,
+                  date_field, prefixes, *etag_parts):
+    """Страница queryset по ?cursor= в JSON с полями из ?fields=.
+
+    ETag считается до выборки страницы: по самой новой строке (date_field
+    и id, один запрос по индексу), версиям ALL_PAGES (её сдвигает
+    переименование пользователей и групп) и закэшированных страниц
+    prefixes (их сдвигают правки и комментарии), курсору и полям.
+    Совпавший If-None-Match получает 304 без выборки страницы.
+    """
+    fields = get_fields(request, spec)
+    if fields is None:
+        return error(400, 'Неизвестное поле в fields: доступны {}'.format(
+            ', '.join(spec)))
+    cursor = request.GET.get('cursor')
+    newest = queryset.order_by(f'-{date_field}', '-pk').values_list(
+        date_field, 'pk').first()
+    etag = make_etag(
+        newest, get_version(ALL_PAGES, *prefixes), cursor, fields,
+        *etag_parts)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        paginator = paginator_class(queryset, per_page)
+        columns = ['pk', paginator.key_field]
+        columns += [spec[field] for field in fields]
+        paginator.object_list = queryset.values(*dict.fromkeys(columns))
+        page = paginator.get_page(cursor)
+        response = JsonResponse({
+            'results': [serialize(row, fields, spec) for row in page],
+            'next_cursor': page.next_cursor,
+            'previous_cursor': page.previous_cursor,
+        })
+    response['ETag'] = etag
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def feed_response(request, queryset, prefixes, *etag_parts):
+    """Лента постов: в ETag входит и версия счётчиков комментариев."""
+    return page_response(
+        request, queryset, CursorPaginator, settings.POSTS_PER_PAGE,
+        POST_FIELDS, 'pub_date', [*prefixes, COMMENT_COUNTS], *etag_parts)
+
+
+@query_budget(4)
+def index(request):
+    """Все посты, от новых к старым."""
+    return feed_response(request, Post.objects.all(), [INDEX_PAGE])
+
+
+@query_budget(5)
+def group_posts(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return error(404, 'Группа не найдена')
+    return feed_response(
+        request, Post.objects.filter(group_id=group_id), [group_page(slug)])
+
+
+@query_budget(5)
+def profile(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return error(404, 'Пользователь не найден')
+    return feed_response(
+        request, Post.objects.filter(author_id=author_id),
+        [profile_page(username)])
+
+
+@query_budget(5)
+def follow_index(request):
+    """Лента подписок текущего пользователя.
+
+    Состав подписок входит в ETag через версию user_state: её сдвигает
+    каждая подписка и отписка.
+    """
+    if not request.user.is_authenticated:
+        return error(401, 'Нужна авторизация')
+    response = feed_response(
+        request, follow_feed(request.user),
+        [INDEX_PAGE, user_state(request.user.pk)], request.user.pk)
+    patch_cache_control(response, private=True)
+    return response
+
+
+@query_budget(5)
+def post_comments(request, post_id):
+    """Комментарии поста в порядке веток."""
+    if not Post.objects.filter(pk=post_id).exists():
+        return error(404, 'Пост не найден')
+    return page_response(
+        request, Comment.objects.filter(post_id=post_id),
+        CommentCursorPaginator, settings.COMMENTS_PER_PAGE, COMMENT_FIELDS,
+        'created', [post_page(post_id)])
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import api
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', api.index, name='index'),
+    path('groups/<slug:slug>/posts/', api.group_posts, name='group_posts'),
+    path('profiles/<str:username>/posts/', api.profile, name='profile'),
+    path('follow/', api.follow_index, name='follow_index'),
+    path(
+        'posts/<int:post_id>/comments/', api.post_comments,
+        name='post_comments'
+    ),
+]
@@ -0,0 +1,187 @@
+import logging
+import threading
+from bisect import bisect_left
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from .models import Group
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+USER = 'user'
+GROUP = 'group'
+# Журнал изменений в общем кэше: процесс, изменивший пользователя или
+# группу, кладёт изменение под следующим номером SEQUENCE_KEY, а индексы
+# всех процессов дочитывают журнал с номера, на котором остановились.
+# Общим кэш делает settings.CACHE_LOCATION; с LocMemCache журнал у
+# каждого процесса свой (об этом предупреждает проверка core.W001).
+SEQUENCE_KEY = 'autocomplete:sequence'
+CHANGE_KEY = 'autocomplete:change:{}'
+# Сколько хранится запись журнала. Процесс, отставший сильнее (или
+# после очистки кэша), перестраивает индекс из БД.
+CHANGE_TIMEOUT = 60 * 60 * 24
+
+
+class PrefixIndex:
+    """Отсортированный список (ключ, тип, id, значение, подпись) в памяти.
+
+    Поиск по префиксу - bisect и проход по соседним записям, без
+    обращения к БД. Записи одного объекта (например, slug и название
+    группы) хранятся по (тип, id), чтобы их можно было заменить.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.by_object = {}
+        self.sequence = None
+        self.lock = threading.RLock()
+
+    def build(self, sequence):
+        """Заново читает всех пользователей и группы из БД."""
+        by_object = {}
+        users = User.objects.filter(is_active=True).values_list(
+            'pk', 'username', 'first_name', 'last_name')
+        for pk, username, first_name, last_name in users.iterator():
+            label = f'{first_name} {last_name}'.strip() or username
+            by_object[USER, pk] = self.user_entries(pk, username, label)
+        for pk, slug, title in Group.objects.values_list(
+                'pk', 'slug', 'title').iterator():
+            by_object[GROUP, pk] = self.group_entries(pk, slug, title)
+        entries = sorted(
+            entry for object_entries in by_object.values()
+            for entry in object_entries)
+        with self.lock:
+            self.entries, self.by_object = entries, by_object
+            self.sequence = sequence
+
+    @staticmethod
+    def user_entries(pk, username, label):
+        return [(username.lower(), USER, pk, username, label)]
+
+    @staticmethod
+    def group_entries(pk, slug, title):
+        keys = {slug.lower(), title.lower()}
+        return [(key, GROUP, pk, slug, title) for key in sorted(keys)]
+
+    def replace(self, kind, pk, entries):
+        """Заменяет записи объекта (kind, pk); пустой entries - удаление."""
+        with self.lock:
+            current = list(self.entries)
+            for entry in self.by_object.pop((kind, pk), ()):
+                index = bisect_left(current, entry)
+                if index < len(current) and current[index] == entry:
+                    del current[index]
+            for entry in entries:
+                current.insert(bisect_left(current, entry), entry)
+            if entries:
+                self.by_object[kind, pk] = entries
+            self.entries = current
+
+    def search(self, prefix, limit):
+        """До limit объектов, у которых есть ключ, начинающийся с prefix."""
+        prefix = prefix.lower()
+        entries = self.entries
+        found = {}
+        index = bisect_left(entries, (prefix,))
+        while index < len(entries) and len(found) < limit:
+            key, kind, pk, value, label = entries[index]
+            if not key.startswith(prefix):
+                break
+            found.setdefault((kind, pk), (kind, value, label))
+            index += 1
+        return list(found.values())
+
+
+index = PrefixIndex()
+
+
+def current_sequence():
+    """Номер последнего изменения в журнале."""
+    sequence = cache.get(SEQUENCE_KEY)
+    if sequence is None:
+        cache.add(SEQUENCE_KEY, 0, None)
+        sequence = cache.get(SEQUENCE_KEY, 0)
+    return sequence
+
+
+def sync(prefix_index):
+    """Доводит prefix_index до последнего изменения в журнале.
+
+    Обычно это одно чтение номера из кэша и, если были изменения, один
+    get_many записей журнала. Из БД индекс строится при первом обращении
+    и когда журнал потерян: запись в середине истекла или номер
+    сбросился вместе с кэшем. Запись, номер которой уже выдан, но сама
+    она ещё не записана, применяется при следующем обращении.
+    """
+    sequence = current_sequence()
+    with prefix_index.lock:
+        known = prefix_index.sequence
+        if known == sequence:
+            return prefix_index
+        if known is not None and known < sequence:
+            keys = [CHANGE_KEY.format(number)
+                    for number in range(known + 1, sequence + 1)]
+            changes = cache.get_many(keys)
+            applied = 0
+            while applied < len(keys) and keys[applied] in changes:
+                applied += 1
+            if not any(key in changes for key in keys[applied:]):
+                for key in keys[:applied]:
+                    prefix_index.replace(*changes[key])
+                prefix_index.sequence = known + applied
+                return prefix_index
+        prefix_index.build(sequence)
+    return prefix_index
+
+
+def get_index():
+    """Индекс этого процесса с применёнными изменениями из журнала."""
+    return sync(index)
+
+
+def warm():
+    """Строит индекс при запуске процесса, до первого запроса.
+
+    Если БД недоступна, процесс всё равно запускается, а индекс
+    строится при первом обращении.
+    """
+    try:
+        get_index()
+    except DatabaseError:
+        logger.exception('Индекс автодополнения не построен при запуске')
+
+
+def changed(kind, pk, entries):
+    """Записывает изменение в журнал; индексы всех процессов, и этого
+    тоже, применят его при следующем обращении."""
+    try:
+        sequence = cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, None)
+        sequence = cache.incr(SEQUENCE_KEY)
+    cache.set(
+        CHANGE_KEY.format(sequence), (kind, pk, entries), CHANGE_TIMEOUT)
+
+
+def user_changed(user):
+    entries = []
+    if user.is_active:
+        label = user.get_full_name() or user.username
+        entries = PrefixIndex.user_entries(user.pk, user.username, label)
+    changed(USER, user.pk, entries)
+
+
+def user_deleted(user):
+    changed(USER, user.pk, [])
+
+
+def group_changed(group):
+    changed(GROUP, group.pk, PrefixIndex.group_entries(
+        group.pk, group.slug, group.title))
+
+
+def group_deleted(group):
+    changed(GROUP, group.pk, [])
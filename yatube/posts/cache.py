@@ -0,0 +1,233 @@
+import hashlib
+import time
+import uuid
+from functools import wraps
+
+from core.fragments import fill
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Group
+
+User = get_user_model()
+
+ALL_PAGES = 'pages'
+INDEX_PAGE = 'index_page'
+# Счётчики комментариев в карточках лент. Карточка берёт их из фрагмента
+# comments_summary, поэтому версия входит только в ETag лент.
+COMMENT_COUNTS = 'comment_counts'
+
+
+def group_page(slug):
+    return f'group_page:{slug}'
+
+
+def profile_page(username):
+    return f'profile_page:{username}'
+
+
+def post_page(post_id):
+    return f'post_page:{post_id}'
+
+
+def user_state(user_id):
+    """Личное состояние пользователя в страницах (подписки)."""
+    return f'user_state:{user_id}'
+
+
+def feed_pages(author_id, group_ids=()):
+    """Префиксы лент, в которых выводится карточка поста."""
+    prefixes = [INDEX_PAGE]
+    prefixes.extend(
+        profile_page(username) for username in User.objects.filter(
+            pk=author_id).values_list('username', flat=True))
+    group_ids = set(group_ids) - {None}
+    if group_ids:
+        prefixes.extend(
+            group_page(slug) for slug in Group.objects.filter(
+                pk__in=group_ids).values_list('slug', flat=True))
+    return prefixes
+
+
+def posts_pages(posts):
+    """Префиксы страниц, на которых выводятся посты queryset posts:
+    страниц самих постов и лент с их карточками."""
+    prefixes = []
+    for pk, author_id, group_id in posts.values_list(
+            'pk', 'author_id', 'group_id'):
+        prefixes.append(post_page(pk))
+        prefixes.extend(feed_pages(author_id, {group_id}))
+    return list(dict.fromkeys(prefixes))
+
+
+def new_version():
+    """Версия: время сдвига в микросекундах и случайный хвост."""
+    return f'{time.time_ns() // 1000:x}-{uuid.uuid4().hex[:8]}'
+
+
+def version_time(version):
+    """Время сдвига версии (timestamp) или None для версии без него."""
+    stamp, separator, _ = version.partition('-')
+    if not separator:
+        return None
+    return int(stamp, 16) / 10 ** 6
+
+
+def get_versions(*prefixes):
+    """Текущие версии страниц с префиксами prefixes, по порядку."""
+    keys = [f'{prefix}:version' for prefix in prefixes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if versions.get(key) is None:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(*prefixes):
+    """Текущая версия закэшированных страниц с префиксами prefixes."""
+    return '.'.join(get_versions(*prefixes))
+
+
+def bump_version(*prefixes):
+    """Делает все закэшированные страницы с префиксами prefixes
+    устаревшими."""
+    cache.set_many(
+        {f'{prefix}:version': new_version() for prefix in prefixes},
+        None,
+    )
+
+
+def page_key(prefix, request, shared=False):
+    """Ключ страницы без версии: пользователь и полный путь запроса."""
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    owner = 'shared' if shared else request.user.pk or 0
+    return f'{prefix}:{owner}:{path}'
+
+
+def versioned_cache_page(timeout, key_prefix, per_user=True):
+    """Кэширует страницу до смены версии key_prefix.
+
+    В отличие от cache_page страница сбрасывается событием (bump_version),
+    а не по истечении короткого таймаута. Пересобирает страницу только
+    запрос, взявший блокировку; остальные запросы в это время получают
+    предыдущую версию страницы, если она есть.
+
+    key_prefix - строка или функция от аргументов view. При
+    settings.SHARED_PAGE_CACHE страница кэшируется одна на всех, а
+    фрагменты пользователя ({% fragment %}) заполняются после чтения из
+    кэша; иначе страница кэшируется отдельно для каждого пользователя
+    (per_user) или не кэшируется вовсе. Фрагменты volatile заполняются
+    после чтения из кэша в обоих случаях.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            shared = settings.SHARED_PAGE_CACHE
+            if request.method not in ('GET', 'HEAD') or not (
+                    shared or per_user):
+                return view_func(request, *args, **kwargs)
+            request.shared_page = shared
+            request.cached_page = True
+            prefix = key_prefix(**kwargs) if callable(key_prefix) else (
+                key_prefix)
+            base_key = page_key(prefix, request, shared)
+            key = f'{base_key}:{get_version(ALL_PAGES, prefix)}'
+            response = cache.get(key)
+            if response is None:
+                response = _rebuild(
+                    view_func, request, args, kwargs, key, base_key, timeout)
+            if response.status_code == 200:
+                response.content = fill(
+                    response.content.decode(response.charset), request)
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def resolve_prefixes(key_prefix, kwargs):
+    """Список префиксов из строки, списка или функции от аргументов
+    view."""
+    prefixes = key_prefix(**kwargs) if callable(key_prefix) else key_prefix
+    return [prefixes] if isinstance(prefixes, str) else list(prefixes)
+
+
+def client_state(request):
+    """Сессия и CSRF-cookie клиента. После нового входа они другие, и
+    страница с формой приходит заново со свежим csrfmiddlewaretoken."""
+    session = getattr(request, 'session', None)
+    return '{}:{}'.format(
+        session.session_key if session is not None else '',
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+
+
+def conditional_page(key_prefix, feed=False):
+    """Отвечает 304 на условный GET, пока страница не устарела.
+
+    Свежесть проверяется только по кэшу, без запросов к БД и отрисовки:
+    ETag - версии ALL_PAGES и key_prefix (их сдвигают те же события,
+    что сбрасывают кэш страниц), личное состояние пользователя, его
+    сессия и CSRF-cookie (client_state) и путь запроса; Last-Modified -
+    время последнего сдвига этих версий. От сессии оно не зависит,
+    поэтому отправляется только гостям.
+    Last-Modified точен до секунды, поэтому отправляется и проверяется,
+    только когда секунда последнего сдвига прошла: иначе сдвиг позже в
+    ту же секунду дал бы клиенту с одним If-Modified-Since 304 на
+    устаревшую страницу.
+    key_prefix - строка, список или функция от аргументов view. ETag
+    ленты (feed) зависит и от версии COMMENT_COUNTS.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            prefixes = [ALL_PAGES, *resolve_prefixes(key_prefix, kwargs)]
+            if feed:
+                prefixes.append(COMMENT_COUNTS)
+            user_id = request.user.pk
+            if user_id:
+                prefixes.append(user_state(user_id))
+            versions = get_versions(*prefixes)
+            etag = quote_etag(hashlib.md5('{}:{}:{}:{}'.format(
+                '.'.join(versions), user_id or 0, client_state(request),
+                request.get_full_path(),
+            ).encode()).hexdigest())
+            times = [version_time(version) for version in versions]
+            last_modified = None
+            if not user_id and None not in times and (
+                    time.time() >= int(max(times)) + 1):
+                last_modified = int(max(times))
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+                patch_cache_control(
+                    response, no_cache=True, private=bool(user_id))
+            return response
+        return _wrapped_view
+    return decorator
+
+
+def _rebuild(view_func, request, args, kwargs, key, base_key, timeout):
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, settings.PAGE_CACHE_LOCK_TIMEOUT):
+        stale = cache.get(f'{base_key}:last')
+        if stale is not None:
+            return stale
+        return view_func(request, *args, **kwargs)
+    try:
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == 200 and not response.streaming:
+            cache.set_many(
+                {key: response, f'{base_key}:last': response}, timeout)
+    finally:
+        cache.delete(lock_key)
+    return response
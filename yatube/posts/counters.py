@@ -0,0 +1,115 @@
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+PATHS_BATCH_SIZE = 1000
+
+
+def bump(model, field, delta, **lookup):
+    """Атомарно меняет счётчик field найденной по lookup строки на delta.
+
+    Пустой ключ (например, пост без группы) ничего не меняет, счётчик
+    не уходит в минус.
+    """
+    if None in lookup.values():
+        return
+    queryset = model.objects.filter(**lookup)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def _count(model, field, outer='pk'):
+    """Подзапрос количества строк model, ссылающихся на OuterRef(outer)."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef(outer)})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def last_commenter(comment_model, outer='pk'):
+    """Подзапрос автора последнего комментария к посту OuterRef(outer)."""
+    return Subquery(
+        comment_model.objects.filter(post=OuterRef(outer))
+        .order_by('-created', '-pk')
+        .values('author')[:1]
+    )
+
+
+def recount(apps=global_apps):
+    """Пересчитывает все денормализованные счётчики по исходным таблицам.
+
+    Принимает реестр приложений, чтобы работать и из миграций.
+    """
+    app_label, model_name = settings.AUTH_USER_MODEL.split('.')
+    User = apps.get_model(app_label, model_name)
+    Profile = apps.get_model('posts', 'Profile')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    with transaction.atomic():
+        Profile.objects.bulk_create(
+            Profile(user_id=pk) for pk in User.objects.filter(
+                profile__isnull=True).values_list('pk', flat=True)
+        )
+        Profile.objects.update(
+            posts_count=_count(Post, 'author', 'user_id'),
+            followers_count=_count(Follow, 'author', 'user_id'),
+            following_count=_count(Follow, 'user', 'user_id'),
+        )
+        Group.objects.update(posts_count=_count(Post, 'group'))
+        Post.objects.update(comments_count=_count(Comment, 'post'))
+
+
+def recount_last_commenters(apps=global_apps):
+    """Заново находит автора последнего комментария к каждому посту."""
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Post.objects.update(last_commenter=last_commenter(Comment))
+
+
+def fill_comment_paths(apps=global_apps):
+    """Заполняет пустой Comment.path, например после bulk_create."""
+    from .models import comment_path
+    Comment = apps.get_model('posts', 'Comment')
+    paths = {}
+    changed = []
+    missing = Comment.objects.filter(path='').order_by('pk').only(
+        'pk', 'parent_id', 'path')
+    for comment in missing.iterator():
+        parent_path = ''
+        if comment.parent_id:
+            parent_path = paths.get(comment.parent_id)
+            if parent_path is None:
+                parent_path = Comment.objects.filter(
+                    pk=comment.parent_id).values_list(
+                        'path', flat=True).first() or ''
+        comment.path = paths[comment.pk] = comment_path(
+            parent_path, comment.pk)
+        changed.append(comment)
+        if len(changed) >= PATHS_BATCH_SIZE:
+            Comment.objects.bulk_update(changed, ['path'])
+            changed = []
+    Comment.objects.bulk_update(changed, ['path'])
+
+
+def recount_images(apps=global_apps):
+    """Пересчитывает, сколько постов ссылается на каждый файл картинки."""
+    Post = apps.get_model('posts', 'Post')
+    ImageBlob = apps.get_model('posts', 'ImageBlob')
+    with transaction.atomic():
+        names = set(Post.objects.exclude(image='').values_list(
+            'image', flat=True))
+        names -= set(ImageBlob.objects.values_list('name', flat=True))
+        ImageBlob.objects.bulk_create(ImageBlob(name=name) for name in names)
+        ImageBlob.objects.update(refs=_count(Post, 'image', 'name'))
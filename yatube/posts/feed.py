@@ -0,0 +1,192 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import FeedItem, Follow, Post, Profile
+from .thumbnails import run_in_background
+
+
+def is_fanned_out(author_id, lock=False):
+    """Раздаются ли посты автора по лентам подписчиков при записи.
+
+    Режим хранится в Profile.fanned_out и меняется только в
+    switch_mode(), вместе с содержимым лент. С lock строка профиля
+    блокируется до конца транзакции: так запись в ленты не
+    разминётся с переключением режима.
+    """
+    profiles = Profile.objects.filter(user_id=author_id)
+    if lock:
+        profiles = profiles.select_for_update()
+    fanned_out = profiles.values_list('fanned_out', flat=True).first()
+    return fanned_out is not False
+
+
+def target_mode(followers_count, fanned_out):
+    """Должны ли раздаваться посты автора с followers_count подписчиками.
+
+    Посты авторов с числом подписчиков больше
+    settings.FEED_FANOUT_MAX_FOLLOWERS подмешиваются в ленту при
+    чтении. Раздача возобновляется, только когда подписчиков не больше
+    settings.FEED_FANOUT_RESUME_FOLLOWERS: подписки и отписки у порога
+    не переключают режим туда и обратно.
+    """
+    if fanned_out:
+        return followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS
+    return followers_count <= resume_threshold()
+
+
+def resume_threshold():
+    """Порог возобновления раздачи, не выше порога её остановки."""
+    return min(settings.FEED_FANOUT_RESUME_FOLLOWERS,
+               settings.FEED_FANOUT_MAX_FOLLOWERS)
+
+
+def get_mode(author_id):
+    """(followers_count, fanned_out) автора или None без профиля."""
+    return Profile.objects.filter(user_id=author_id).values_list(
+        'followers_count', 'fanned_out').first()
+
+
+def sync_mode(author_id):
+    """Ставит переключение режима автора в фон, если число подписчиков
+    пересекло порог. Ленты в транзакции запроса не переписываются."""
+    mode = get_mode(author_id)
+    if mode is not None and target_mode(*mode) != mode[1]:
+        run_in_background(f'feed_mode:{author_id}', switch_mode, author_id)
+
+
+def switch_mode(author_id):
+    """Переключает режим автора, пока он не совпадёт с числом
+    подписчиков. Ленты меняются порциями по settings.FEED_BATCH_SIZE.
+
+    К подмешиванию автор переходит сразу, а его записи удаляются из
+    лент после. К раздаче - наоборот: сначала ленты заполняются
+    постами автора (пока они ещё подмешиваются при чтении), затем под
+    блокировкой профиля режим переключается и дописываются посты и
+    подписки, появившиеся за это время.
+    """
+    while True:
+        mode = get_mode(author_id)
+        if mode is None or target_mode(*mode) == mode[1]:
+            return
+        if mode[1]:
+            Profile.objects.filter(user_id=author_id).update(
+                fanned_out=False)
+            _clear(author_id)
+        else:
+            _resume(author_id)
+
+
+def sync_modes():
+    """Приводит режимы всех авторов в соответствие с их счётчиками."""
+    mismatched = Profile.objects.filter(
+        Q(fanned_out=True,
+          followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        | Q(fanned_out=False, followers_count__lte=resume_threshold())
+    ).values_list('user_id', flat=True)
+    for author_id in mismatched:
+        switch_mode(author_id)
+
+
+def _clear(author_id):
+    """Удаляет посты автора из всех лент порциями."""
+    items = FeedItem.objects.filter(post__author_id=author_id).values_list(
+        'pk', flat=True)
+    while True:
+        batch = list(items[:settings.FEED_BATCH_SIZE])
+        if not batch:
+            return
+        FeedItem.objects.filter(pk__in=batch).delete()
+
+
+def _resume(author_id):
+    """Заполняет ленты подписчиков постами автора и включает раздачу.
+
+    Если за время заполнения подписчиков снова стало больше порога,
+    записанное удаляется, а режим не меняется.
+    """
+    posts = Post.objects.filter(author_id=author_id)
+    follows = Follow.objects.filter(author_id=author_id)
+    last_post = posts.aggregate(last=Max('pk'))['last'] or 0
+    last_follow = follows.aggregate(last=Max('pk'))['last'] or 0
+    batches = follows.filter(pk__lte=last_follow).order_by('pk').values_list(
+        'pk', 'user_id')
+    done = 0
+    while True:
+        batch = list(batches.filter(pk__gt=done)[:settings.FEED_BATCH_SIZE])
+        if not batch:
+            break
+        _deliver([user_id for _, user_id in batch],
+                 posts.filter(pk__lte=last_post))
+        done = batch[-1][0]
+    with transaction.atomic():
+        mode = Profile.objects.select_for_update().filter(
+            user_id=author_id).values_list(
+                'followers_count', 'fanned_out').first()
+        if mode is None or not target_mode(*mode):
+            _clear(author_id)
+            return
+        Profile.objects.filter(user_id=author_id).update(fanned_out=True)
+        followers = follows.values_list('user_id', flat=True)
+        _deliver(followers.filter(pk__lte=last_follow),
+                 posts.filter(pk__gt=last_post))
+        for user_id in followers.filter(pk__gt=last_follow):
+            _deliver([user_id], posts)
+        FeedItem.objects.filter(post__author_id=author_id).exclude(
+            user_id__in=followers).delete()
+
+
+def fan_out(post):
+    """Доставляет новый пост в ленты подписчиков автора."""
+    with transaction.atomic(savepoint=False):
+        if is_fanned_out(post.author_id, lock=True):
+            _deliver(Follow.objects.filter(
+                author_id=post.author_id).values_list('user_id', flat=True),
+                Post.objects.filter(pk=post.pk))
+
+
+def backfill(user_id, author_id):
+    """Заполняет ленту подписчика ранее опубликованными постами автора."""
+    with transaction.atomic(savepoint=False):
+        if is_fanned_out(author_id, lock=True):
+            _deliver([user_id], Post.objects.filter(author_id=author_id))
+
+
+def _deliver(user_ids, posts):
+    """Записывает посты queryset posts в ленты пользователей user_ids."""
+    if not isinstance(user_ids, list):
+        user_ids = list(user_ids.iterator())
+    if not user_ids:
+        return
+    posts = posts.order_by().values_list('pk', 'pub_date')
+    FeedItem.objects.bulk_create(
+        (FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts.iterator()
+         for user_id in user_ids),
+        batch_size=settings.FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def prune(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    FeedItem.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def follow_feed(user):
+    """Посты ленты подписок пользователя, от новых к старым.
+
+    Обычно лента читается из собственной таблицы по индексу
+    (user, -pub_date); посты авторов, не раздаваемых при записи,
+    добавляются к ней при чтении.
+    """
+    merged_authors = list(Follow.objects.filter(
+        user=user, author__profile__fanned_out=False,
+    ).values_list('author_id', flat=True))
+    if not merged_authors:
+        return Post.objects.filter(feed_items__user=user).order_by(
+            '-feed_items__pub_date', '-pk')
+    inbox = FeedItem.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=inbox) | Q(author_id__in=merged_authors))
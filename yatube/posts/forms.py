@@ -1,9 +1,31 @@
+from core.uploads import check_image_upload
 from django import forms
+from django.core.exceptions import ValidationError
 
 from .models import Comment, Post
 
 
-class PostForm(forms.ModelForm):
+class ImageUploadMixin:
+    """Проверка картинки поста для любой формы с полем image."""
+
+    def full_clean(self):
+        """Отклоняет неподходящую картинку до того, как её откроет
+        ImageField."""
+        upload = self.files.get('image') if self.is_bound else None
+        upload_error = None
+        if upload:
+            try:
+                check_image_upload(upload)
+            except ValidationError as error:
+                upload_error = error
+                self.files = self.files.copy()
+                del self.files['image']
+        super().full_clean()
+        if upload_error:
+            self.add_error('image', upload_error)
+
+
+class PostForm(ImageUploadMixin, forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(PostForm, self).__init__(*args, **kwargs)
         self.fields['text'].required = True
@@ -17,6 +39,12 @@ class PostForm(forms.ModelForm):
         fields = ('text', 'group', 'image')
 
 
+class PostAdminForm(ImageUploadMixin, forms.ModelForm):
+    class Meta:
+        model = Post
+        fields = '__all__'
+
+
 class CommentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super(CommentForm, self).__init__(*args, **kwargs)
@@ -0,0 +1,86 @@
+from core.fragments import fragment
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from .cache import ALL_PAGES, get_versions, post_page
+from .forms import CommentForm
+from .models import Follow, Post, Profile
+
+
+@fragment('switcher')
+def switcher(request):
+    return render_to_string('posts/includes/switcher.html', request=request)
+
+
+@fragment('subscribe')
+def subscribe(request, username):
+    if not request.user.is_authenticated:
+        return ''
+    following = Follow.objects.filter(
+        user=request.user, author__username=username).exists()
+    return render_to_string(
+        'posts/includes/subscribe.html',
+        {'username': username, 'following': following},
+        request=request,
+    )
+
+
+@fragment('edit_button')
+def edit_button(request, post_id, author_id):
+    if str(request.user.id) != author_id:
+        return ''
+    return render_to_string(
+        'posts/includes/edit_button.html', {'post_id': post_id})
+
+
+@fragment('comment_form')
+def comment_form(request, post_id):
+    if not request.user.is_authenticated:
+        return ''
+    return render_to_string(
+        'posts/includes/comment_form.html',
+        {'post_id': post_id, 'form': CommentForm()},
+        request=request,
+    )
+
+
+@fragment('author_posts_count')
+def author_posts_count(request, author_id):
+    """Счётчик постов автора меняется чаще, чем сама страница поста."""
+    posts_count = Profile.objects.filter(user_id=author_id).values_list(
+        'posts_count', flat=True).first()
+    return str(posts_count or 0)
+
+
+@fragment('comments_summary', volatile=True, batched=True)
+def comments_summary(request, calls):
+    """Счётчик комментариев и последний комментатор карточек постов.
+
+    Меняются с каждым комментарием, поэтому не входят в кэш лент, а
+    хранятся отдельно до сдвига версии post_page поста или ALL_PAGES
+    (переименование комментатора). Промахи кэша
+    всей страницы выбираются одним запросом.
+    """
+    post_ids = [post_id for post_id, in calls]
+    everything, *versions = get_versions(
+        ALL_PAGES, *map(post_page, post_ids))
+    keys = {
+        post_id: f'comments_summary:{post_id}:{everything}.{version}'
+        for post_id, version in zip(post_ids, versions)
+    }
+    found = cache.get_many(keys.values())
+    missing = [post_id for post_id, key in keys.items() if key not in found]
+    if missing:
+        posts = Post.objects.filter(pk__in=missing).select_related(
+            'last_commenter').only(
+                'comments_count', 'last_commenter__username',
+                'last_commenter__first_name', 'last_commenter__last_name')
+        rendered = {
+            keys[str(post.pk)]: render_to_string(
+                'posts/includes/comments_summary.html', {'post': post})
+            for post in posts
+        }
+        cache.set_many(rendered, settings.PAGE_CACHE_TIMEOUT)
+        found.update(rendered)
+    return {(post_id,): found.get(key, '') for post_id, key in keys.items()}
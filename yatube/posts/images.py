@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import F
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from . import variants
+from .counters import bump
+from .models import ImageBlob
+from .storage import image_storage
+from .thumbnails import run_in_background
+
+
+def acquire(name):
+    """Учитывает ещё один пост, ссылающийся на файл картинки name."""
+    if ImageBlob.objects.filter(name=name).update(refs=F('refs') + 1):
+        return
+    _, created = ImageBlob.objects.get_or_create(
+        name=name, defaults={'refs': 1})
+    if not created:
+        bump(ImageBlob, 'refs', 1, name=name)
+
+
+def release(name):
+    """Снимает ссылку поста на файл name; файл без ссылок удаляется
+    в фоне после коммита."""
+    bump(ImageBlob, 'refs', -1, name=name)
+    run_in_background(f'collect:{name}', collect, name)
+
+
+def collect(name):
+    """Удаляет файл name с миниатюрами и вариантами, если на него больше
+    не ссылается ни один пост.
+
+    Строка ImageBlob блокируется до удаления файла, как и при повторной
+    загрузке того же содержимого (ContentAddressedStorage.reserve).
+    """
+    with transaction.atomic():
+        refs = ImageBlob.objects.select_for_update().filter(
+            name=name).values_list('refs', flat=True).first()
+        if refs != 0:
+            return False
+        ImageBlob.objects.filter(name=name).delete()
+        default.kvstore.delete(ImageFile(name, image_storage))
+        variants.delete_files(name)
+        image_storage.delete(name)
+    return True
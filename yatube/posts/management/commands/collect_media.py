@@ -0,0 +1,183 @@
+import posixpath
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from posts import variants
+from posts.models import ImageBlob, ImageVariant, Post
+from posts.storage import image_storage
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы картинок, вариантов и миниатюр, на которые не '
+            'ссылается ни один пост, и устаревшие записи миниатюр sorl. '
+            'Хранилище и БД обходятся пачками, память не зависит от '
+            'числа файлов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, что было бы удалено.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько файлов проверять одним запросом к БД.')
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help='Сколько файлов удалять параллельно.')
+        parser.add_argument(
+            '--min-age', type=int, default=60 * 60,
+            help='Не трогать файлы моложе стольких секунд (загрузки, '
+                 'которые ещё не записаны в БД).')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.verbose = self.dry_run or options['verbosity'] > 1
+        self.batch_size = options['batch_size']
+        self.cutoff = timezone.now() - timedelta(seconds=options['min_age'])
+        self.stats = Counter()
+        variant_storage = ImageVariant._meta.get_field('file').storage
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            self.pool = pool
+            self.sweep(
+                'images', image_storage, 'posts', self.referenced_images,
+                self.delete_image, skip={'posts/variants'},
+                forget=self.forget_images,
+            )
+            self.purge_kvstore()
+            self.sweep(
+                'variants', variant_storage, 'posts/variants',
+                self.referenced_variants, variant_storage.delete,
+            )
+            self.sweep(
+                'thumbnails', default.storage,
+                sorl_settings.THUMBNAIL_PREFIX.rstrip('/'),
+                self.referenced_thumbnails, default.storage.delete,
+            )
+        verb = 'Будет удалено' if self.dry_run else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: картинок {self.stats["images"]}, вариантов '
+            f'{self.stats["variants"]}, миниатюр {self.stats["thumbnails"]}'
+            f' ({self.stats["bytes"] // 1024} КБ), записей sorl '
+            f'{self.stats["kvstore"]}'))
+
+    def walk(self, storage, directory, skip=()):
+        """Файлы directory старше --min-age, по одному каталогу за раз."""
+        if directory in skip or not storage.exists(directory):
+            return
+        subdirectories, files = storage.listdir(directory)
+        for name in files:
+            name = posixpath.join(directory, name)
+            if storage.get_modified_time(name) < self.cutoff:
+                yield name
+        for subdirectory in subdirectories:
+            yield from self.walk(
+                storage, posixpath.join(directory, subdirectory), skip)
+
+    def sweep(self, kind, storage, directory, referenced, delete, skip=(),
+              forget=None):
+        """Удаляет файлы directory, которых нет в referenced(batch).
+
+        forget(orphans) в основном потоке чистит записи в БД и
+        возвращает имена, которые можно удалить; файлы удаляются
+        параллельно через delete(name) в той же транзакции.
+        """
+        for batch in batches(
+                self.walk(storage, directory, skip), self.batch_size):
+            orphans = sorted(set(batch) - referenced(batch))
+            if self.dry_run or not orphans:
+                self.count(kind, storage, orphans)
+                continue
+            with transaction.atomic():
+                if forget:
+                    orphans = forget(orphans)
+                self.count(kind, storage, orphans)
+                list(self.pool.map(delete, orphans))
+
+    def count(self, kind, storage, names):
+        self.stats[kind] += len(names)
+        for name in names:
+            self.stats['bytes'] += storage.size(name)
+            if self.verbose:
+                self.stdout.write(f'{kind}: {name}')
+
+    def referenced_images(self, names):
+        return set(Post.objects.filter(image__in=names).values_list(
+            'image', flat=True))
+
+    def referenced_variants(self, names):
+        return set(ImageVariant.objects.filter(file__in=names).values_list(
+            'file', flat=True))
+
+    def referenced_thumbnails(self, names):
+        keys = {
+            add_prefix(ImageFile(name, default.storage).key): name
+            for name in names
+        }
+        return {
+            keys[key] for key in KVStore.objects.filter(
+                key__in=keys).values_list('key', flat=True)
+        }
+
+    def forget_images(self, names):
+        """Заново проверяет картинки под блокировкой строк ImageBlob
+        (см. ContentAddressedStorage.reserve): после обхода на файл
+        могли сослаться или загрузить его повторно, обновив mtime."""
+        referenced = set(
+            name for name, refs in ImageBlob.objects.select_for_update()
+            .filter(name__in=names).values_list('name', 'refs') if refs)
+        referenced |= self.referenced_images(names)
+        names = [
+            name for name in names if name not in referenced
+            and image_storage.exists(name)
+            and image_storage.get_modified_time(name) < self.cutoff
+        ]
+        for name in names:
+            default.kvstore.delete(ImageFile(name, image_storage))
+        ImageBlob.objects.filter(name__in=names).delete()
+        return names
+
+    def delete_image(self, name):
+        variants.delete_files(name)
+        image_storage.delete(name)
+
+    def purge_kvstore(self):
+        """Удаляет записи sorl о файлах, которых уже нет в хранилище,
+        вместе с миниатюрами таких файлов."""
+        prefix = add_prefix('')
+        last = prefix
+        while True:
+            rows = list(
+                KVStore.objects.filter(
+                    key__startswith=prefix, key__gt=last)
+                .order_by('key')
+                .values_list('key', 'value')[:self.batch_size]
+            )
+            if not rows:
+                return
+            last = rows[-1][0]
+            for key, value in rows:
+                image_file = deserialize_image_file(value)
+                if image_file.exists():
+                    continue
+                self.stats['kvstore'] += 1
+                if not self.dry_run:
+                    default.kvstore.delete(image_file)
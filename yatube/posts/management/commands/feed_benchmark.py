@@ -0,0 +1,118 @@
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import fill_comment_paths, recount
+from posts.models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = ('Выводит планы и время запросов лент (главная, группа, профиль, '
+            'комментарии, подписка). Для сравнения запустите до и после '
+            'миграции с индексами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Сначала создать столько постов (и пропорционально '
+                 'пользователей, групп, комментариев и подписок).')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнить каждый запрос.')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'])
+        author = Post.objects.values_list('author', flat=True).first()
+        if author is None:
+            self.stderr.write('Нет постов, запустите с --seed')
+            return
+        group = Post.objects.exclude(group=None).values_list(
+            'group', flat=True).first()
+        post = Comment.objects.values_list('post', flat=True).first()
+        follow = Follow.objects.values_list('author', 'user').first()
+        limit = settings.POSTS_PER_PAGE
+        queries = {
+            'index': Post.objects.all()[:limit],
+            'group_posts': Post.objects.filter(group=group)[:limit],
+            'profile': Post.objects.filter(author=author)[:limit],
+            'comments': Comment.objects.filter(post=post).order_by('path'),
+        }
+        if follow:
+            queries['following'] = Follow.objects.filter(
+                author=follow[0], user=follow[1])
+        for name, queryset in queries.items():
+            self.report(name, queryset, options['repeat'])
+
+    def report(self, name, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(queryset.explain())
+        self.stdout.write(
+            f'median {statistics.median(timings):.3f} ms, '
+            f'max {max(timings):.3f} ms\n')
+
+    def seed(self, total):
+        users_count = max(total // 100, 2)
+        groups_count = max(total // 10000, 1)
+        self.stdout.write(
+            f'Создаём {total} постов, {users_count} пользователей, '
+            f'{groups_count} групп...')
+        with transaction.atomic():
+            first_user = User.objects.order_by('-pk').values_list(
+                'pk', flat=True).first() or 0
+            User.objects.bulk_create(
+                (User(username=f'bench{first_user + i}')
+                 for i in range(users_count))
+            )
+            users = list(User.objects.filter(
+                pk__gt=first_user).values_list('pk', flat=True))
+            first_group = Group.objects.order_by('-pk').values_list(
+                'pk', flat=True).first() or 0
+            Group.objects.bulk_create(
+                Group(title=f'Группа {first_group + i}',
+                      slug=f'bench-{first_group + i}')
+                for i in range(groups_count)
+            )
+            groups = list(Group.objects.filter(
+                pk__gt=first_group).values_list('pk', flat=True)) + [None]
+            first_post = Post.objects.order_by('-pk').values_list(
+                'pk', flat=True).first() or 0
+            for start in range(0, total, BATCH_SIZE):
+                Post.objects.bulk_create(
+                    Post(text=f'Пост {i}',
+                         author_id=random.choice(users),
+                         group_id=random.choice(groups))
+                    for i in range(start, min(start + BATCH_SIZE, total))
+                )
+            posts = list(Post.objects.filter(
+                pk__gt=first_post).values_list('pk', flat=True))
+            for start in range(0, total, BATCH_SIZE):
+                Comment.objects.bulk_create(
+                    Comment(text='Комментарий',
+                            post_id=random.choice(posts),
+                            author_id=random.choice(users))
+                    for _ in range(start, min(start + BATCH_SIZE, total))
+                )
+            Follow.objects.bulk_create(
+                (Follow(user_id=user, author_id=author)
+                 for user in users
+                 for author in random.sample(users, min(10, len(users)))
+                 if user != author),
+                ignore_conflicts=True,
+            )
+        recount()
+        fill_comment_paths()
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Заново строит полнотекстовый индекс постов и комментариев, '
+            'например после загрузки данных в обход триггеров.')
+
+    def handle(self, *args, **options):
+        rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts import feed
+from posts.counters import (fill_comment_paths, recount, recount_images,
+                            recount_last_commenters)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, комментариев и подписок, '
+            'исправляя расхождения с данными, режимы раздачи лент, '
+            'авторов последних комментариев, пути в ветках комментариев '
+            'и ссылки постов на файлы картинок.')
+
+    def handle(self, *args, **options):
+        recount()
+        feed.sync_modes()
+        recount_last_commenters()
+        fill_comment_paths()
+        recount_images()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,96 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts import variants
+from posts.cache import ALL_PAGES, bump_version
+from posts.models import ImageBlob, ImageVariant, Post
+from posts.storage import image_storage
+
+# Имена, уже разложенные по подкаталогам: каталог/ab/cd/файл.
+SHARDED = r'^[^/]+/[0-9a-f]{2}/[0-9a-f]{2}/[^/]+$'
+
+
+class Command(BaseCommand):
+    help = ('Переносит картинки постов в каталоги с двухуровневым '
+            'префиксом по хэшу содержимого и переписывает пути в БД. '
+            'Работает пачками, прерванный запуск можно повторить.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько файлов переносить за одну пачку.')
+        parser.add_argument(
+            '--batches', type=int, default=0,
+            help='Остановиться после стольких пачек (0 - перенести всё).')
+
+    def handle(self, *args, **options):
+        last = ''
+        moved = missing = batches = 0
+        while not options['batches'] or batches < options['batches']:
+            names = list(
+                Post.objects.exclude(image='')
+                .exclude(image__regex=SHARDED)
+                .filter(image__gt=last)
+                .order_by('image')
+                .values_list('image', flat=True)
+                .distinct()[:options['batch_size']]
+            )
+            if not names:
+                break
+            for name in names:
+                if self.move(name):
+                    moved += 1
+                else:
+                    missing += 1
+            last = names[-1]
+            batches += 1
+            bump_version(ALL_PAGES)
+            self.stdout.write(
+                f'Пачка {batches}: перенесено {moved}, '
+                f'нет файла {missing}, последний {last}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово: перенесено {moved}, нет файла {missing}'))
+
+    def move(self, old):
+        """Переносит файл old с вариантами и переписывает ссылки на него.
+
+        Новый файл записывается до изменения БД, а старый удаляется
+        после коммита, поэтому повторный запуск после сбоя безопасен.
+        """
+        if not image_storage.exists(old):
+            self.stderr.write(f'Нет файла {old}')
+            return False
+        with image_storage.open(old) as file:
+            new = image_storage.save(old, file)
+        if new == old:
+            return True
+        variant_storage = ImageVariant._meta.get_field('file').storage
+        moved_variants = []
+        for variant in ImageVariant.objects.filter(source=old):
+            name = variants.variant_name(new, variant.width, variant.format)
+            if not variant_storage.exists(variant.file.name):
+                continue
+            if not variant_storage.exists(name):
+                with variant_storage.open(variant.file.name) as file:
+                    name = variant_storage.save(name, file)
+            variant.source, variant.file = new, name
+            moved_variants.append(variant)
+        with transaction.atomic():
+            refs = Post.objects.filter(image=old).update(
+                image=new, modified=timezone.now())
+            ImageVariant.objects.filter(source=old).exclude(
+                pk__in=[variant.pk for variant in moved_variants]).delete()
+            ImageVariant.objects.bulk_update(
+                moved_variants, ['source', 'file'])
+            ImageBlob.objects.filter(name=old).delete()
+            if not ImageBlob.objects.filter(name=new).update(
+                    refs=F('refs') + refs):
+                ImageBlob.objects.create(name=new, refs=refs)
+        default.kvstore.delete(ImageFile(old, image_storage))
+        variants.delete_files(old)
+        image_storage.delete(old)
+        return True
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:08
+
+from django.db import migrations, models
+import posts.storage
+
+
+def fill_refs(apps, schema_editor):
+    from posts.counters import recount_images
+    recount_images(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Количество постов')),
+            ],
+            options={
+                'verbose_name': 'Файл картинки',
+                'verbose_name_plural': 'Файлы картинок',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(fill_refs, migrations.RunPython.noop),
+    ]
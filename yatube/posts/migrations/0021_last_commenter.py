@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:17
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_last_commenter(apps, schema_editor):
+    from posts.counters import recount_last_commenters
+    recount_last_commenters(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0020_image_blobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='last_commenter',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор последнего комментария'),
+        ),
+        migrations.RunPython(fill_last_commenter, migrations.RunPython.noop),
+    ]
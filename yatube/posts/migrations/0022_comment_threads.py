@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_paths(apps, schema_editor):
+    from posts.counters import fill_comment_paths
+    fill_comment_paths(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_last_commenter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='comment_post_path'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+from django.db import migrations
+
+CREATE_SQL = (
+    """
+    CREATE VIRTUAL TABLE posts_search USING fts5(
+        text,
+        post_id UNINDEXED,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER posts_search_post_insert AFTER INSERT ON posts_post
+    BEGIN
+        INSERT INTO posts_search(rowid, text, post_id)
+        VALUES (new.id * 2, COALESCE(new.text, ''), new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_post_update
+    AFTER UPDATE OF text ON posts_post BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+        INSERT INTO posts_search(rowid, text, post_id)
+        VALUES (new.id * 2, COALESCE(new.text, ''), new.id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_post_delete AFTER DELETE ON posts_post
+    BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2;
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_insert
+    AFTER INSERT ON posts_comment BEGIN
+        INSERT INTO posts_search(rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_update
+    AFTER UPDATE OF text ON posts_comment BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO posts_search(rowid, text, post_id)
+        VALUES (new.id * 2 + 1, new.text, new.post_id);
+    END
+    """,
+    """
+    CREATE TRIGGER posts_search_comment_delete
+    AFTER DELETE ON posts_comment BEGIN
+        DELETE FROM posts_search WHERE rowid = old.id * 2 + 1;
+    END
+    """,
+)
+
+DROP_SQL = (
+    'DROP TRIGGER IF EXISTS posts_search_post_insert',
+    'DROP TRIGGER IF EXISTS posts_search_post_update',
+    'DROP TRIGGER IF EXISTS posts_search_post_delete',
+    'DROP TRIGGER IF EXISTS posts_search_comment_insert',
+    'DROP TRIGGER IF EXISTS posts_search_comment_update',
+    'DROP TRIGGER IF EXISTS posts_search_comment_delete',
+    'DROP TABLE IF EXISTS posts_search',
+)
+
+
+def run(schema_editor, statements):
+    """Только SQLite: FTS5 и синтаксис триггеров специфичны для неё."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return False
+    for sql in statements:
+        schema_editor.execute(sql, params=None)
+    return True
+
+
+def create_index(apps, schema_editor):
+    if run(schema_editor, CREATE_SQL):
+        from posts.search import REBUILD_SQL
+        run(schema_editor, REBUILD_SQL)
+
+
+def drop_index(apps, schema_editor):
+    run(schema_editor, DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0022_comment_threads'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
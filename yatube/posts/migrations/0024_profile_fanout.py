@@ -0,0 +1,43 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_modes(apps, schema_editor):
+    """Фиксирует режим каждого автора и дозаполняет ленты раздаваемых
+    авторов постами, пропущенными, пока они были выше порога."""
+    Profile = apps.get_model('posts', 'Profile')
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    FeedItem = apps.get_model('posts', 'FeedItem')
+    limit = settings.FEED_FANOUT_MAX_FOLLOWERS
+    Profile.objects.filter(followers_count__gt=limit).update(
+        fanned_out=False)
+    FeedItem.objects.filter(post__author__profile__fanned_out=False).delete()
+    follows = Follow.objects.filter(author__profile__fanned_out=True)
+    for user_id, author_id in follows.values_list(
+            'user_id', 'author_id').iterator():
+        FeedItem.objects.bulk_create(
+            (FeedItem(user_id=user_id, post_id=post_id, pub_date=pub_date)
+             for post_id, pub_date in Post.objects.filter(
+                 author_id=author_id).values_list('pk', 'pub_date')),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0023_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='fanned_out',
+            field=models.BooleanField(default=True, editable=False, help_text='Иначе посты подмешиваются в ленты подписок при чтении', verbose_name='Посты раздаются по лентам'),
+        ),
+        migrations.RunPython(fill_modes, migrations.RunPython.noop),
+    ]
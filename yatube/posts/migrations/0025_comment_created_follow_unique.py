@@ -0,0 +1,28 @@
+# Generated by Django 2.2.16 on 2026-10-18 17:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0024_profile_fanout'),
+    ]
+
+    operations = [
+        # Меняется только verbose_name: без пересоздания таблицы в SQLite,
+        # которое сбросило бы триггеры поиска из 0023.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='comment',
+                name='created',
+                field=models.DateTimeField(auto_now_add=True, verbose_name='Дата создания'),
+            ),
+        ]),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+    ]
@@ -1,12 +1,40 @@
-from core.models import CreatedModel
+from core.models import CountersModel, CreatedModel
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.utils.http import int_to_base36
+
+from .storage import image_storage
 
 User = get_user_model()
 
+# Длина одного уровня Comment.path: id комментария в base36 с нулями.
+PATH_STEP = 8
+PATH_MAX_LENGTH = 255
+# Больше любого символа base36: верхняя граница поддерева в range-запросе.
+PATH_END = '~'
+
+
+def comment_path(parent_path, pk):
+    """Путь комментария pk: путь родителя и собственный id.
+
+    Сортировка по пути выстраивает ветку в порядке показа: ответы
+    идут сразу за родителем, от старых к новым. Слишком глубокие
+    ответы встают на последний уровень, который вмещает поле.
+    """
+    prefix = parent_path[:PATH_MAX_LENGTH - PATH_STEP]
+    return prefix + int_to_base36(pk).zfill(PATH_STEP)
+
+
+def path_depth(path):
+    """Уровень вложенности комментария с путём path: 0 у комментария к
+    посту."""
+    return max(len(path) // PATH_STEP - 1, 0)
+
+
+class Post(CountersModel):
+    counter_fields = ('comments_count', 'last_commenter')
 
-class Post(models.Model):
     text = models.TextField(
         'Текст поста',
         help_text='Введите текст поста',
@@ -19,6 +47,10 @@ class Post(models.Model):
         auto_now_add=True,
         db_index=True,
     )
+    modified = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -37,8 +69,23 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=image_storage,
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False,
+    )
+    last_commenter = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='+',
+        verbose_name='Автор последнего комментария',
+    )
 
     def __str__(self):
         return self.text[:15]
@@ -50,15 +97,28 @@ class Post(models.Model):
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'], name='post_author_date'),
+            models.Index(
+                fields=['group', '-pub_date'], name='post_group_date'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
 
-class Group(models.Model):
+class Group(CountersModel):
+    counter_fields = ('posts_count',)
+
     title = models.CharField(max_length=200, verbose_name='Название группы')
     slug = models.SlugField(unique=True, verbose_name='Идентификатор группы')
     description = models.TextField(blank=True, null=True,
                                    verbose_name='Описание группы')
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+        editable=False,
+    )
 
     def __str__(self):
         return self.title
@@ -81,6 +141,20 @@ class Comment(CreatedModel):
         verbose_name='Автор',
         related_name='comments',
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        related_name='replies',
+        verbose_name='Ответ на',
+    )
+    path = models.CharField(
+        'Путь в ветке',
+        max_length=PATH_MAX_LENGTH,
+        editable=False,
+        default='',
+    )
     text = models.TextField(
         'Текст комментария',
         help_text='Введите текст комментария',
@@ -88,8 +162,41 @@ class Comment(CreatedModel):
         null=False,
     )
 
+    @property
+    def depth(self):
+        """Уровень вложенности: 0 у комментария к посту."""
+        return path_depth(self.path)
+
+    def save(self, *args, **kwargs):
+        """Путь строится из pk, поэтому новый комментарий вставляется с
+        пустым path и дописывается в той же транзакции: строка без пути
+        не видна и не остаётся после сбоя."""
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if not self.path:
+                self.path = comment_path(
+                    self.parent.path if self.parent_id else '', self.pk)
+                Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    def subtree(self):
+        """Комментарий со всеми ответами в порядке показа.
+
+        Диапазон по индексу (post, path) вместо LIKE: в SQLite
+        startswith с ESCAPE индекс не использует.
+        """
+        return Comment.objects.filter(
+            post_id=self.post_id,
+            path__gte=self.path,
+            path__lt=self.path + PATH_END,
+        ).order_by('path')
+
     class Meta:
         ordering = ('created',)
+        indexes = [
+            models.Index(
+                fields=['post', 'created'], name='comment_post_created'),
+            models.Index(fields=['post', 'path'], name='comment_post_path'),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
@@ -112,6 +219,10 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author')
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user'),
+        ]
         verbose_name = 'Подписку'
         verbose_name_plural = 'Подписки'
 
@@ -130,3 +241,107 @@ class Follow(models.Model):
                 'Пользователь не может быть подписан на себя!'
             )
         return super().clean()
+
+
+class Profile(models.Model):
+    """Денормализованные счётчики пользователя."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='profile',
+    )
+    posts_count = models.PositiveIntegerField(
+        'Количество постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        'Количество подписок',
+        default=0,
+    )
+    fanned_out = models.BooleanField(
+        'Посты раздаются по лентам',
+        default=True,
+        editable=False,
+        help_text='Иначе посты подмешиваются в ленты подписок при чтении',
+    )
+
+    def __str__(self):
+        return self.user.get_username()
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+
+class FeedItem(models.Model):
+    """Запись ленты подписок: пост автора, доставленный подписчику."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_items',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_items',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ('-pub_date',)
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date'], name='feed_user_date'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+
+
+class ImageVariant(models.Model):
+    """Уменьшенная копия картинки поста для srcset."""
+    FORMATS = (
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    )
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='image_variants',
+    )
+    source = models.CharField(
+        'Исходная картинка',
+        max_length=255,
+        help_text='Post.image, из которой сделан вариант',
+    )
+    file = models.FileField('Файл', upload_to='posts/variants/')
+    format = models.CharField('Формат', max_length=4, choices=FORMATS)
+    width = models.PositiveIntegerField('Ширина')
+    height = models.PositiveIntegerField('Высота')
+
+    class Meta:
+        ordering = ('format', 'width')
+        unique_together = ('post', 'format', 'width')
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+
+
+class ImageBlob(models.Model):
+    """Файл картинки в хранилище по содержимому и число постов с ним."""
+    name = models.CharField('Файл', max_length=255, unique=True)
+    refs = models.PositiveIntegerField('Количество постов', default=0)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        verbose_name = 'Файл картинки'
+        verbose_name_plural = 'Файлы картинок'
@@ -0,0 +1,224 @@
+import base64
+import binascii
+import json
+
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(obj, direction, field='pub_date'):
+    """Упаковывает ключ (field, id) объекта в непрозрачный токен.
+
+    obj - экземпляр модели или словарь из values() с полями field и pk.
+    """
+    if isinstance(obj, dict):
+        value, pk = obj[field], obj['pk']
+    else:
+        value, pk = getattr(obj, field), obj.pk
+    if hasattr(value, 'isoformat'):
+        value = value.isoformat()
+    raw = json.dumps([value, pk, direction])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, parse=parse_datetime):
+    """Распаковывает токен курсора, для битого токена возвращает None.
+
+    parse превращает строку ключа в значение поля, по умолчанию дату.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        value, pk, direction = json.loads(raw.decode())
+        if not isinstance(value, str):
+            return None
+        value = parse(value)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        return None
+    if value is None or not isinstance(pk, int) or direction not in (
+            NEXT, PREVIOUS):
+        return None
+    return value, pk, direction
+
+
+class CountedPaginator(Paginator):
+    """Пагинатор, берущий число объектов из готового счётчика.
+
+    Без count ведёт себя как обычный Paginator и выполняет COUNT.
+    """
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для списков админки по большим таблицам.
+
+    Строки считаются не дальше settings.ADMIN_COUNT_LIMIT, для меньших
+    списков это точное число. Если предел достигнут, а фильтров и поиска
+    нет, число строк берётся из статистики БД (estimate_rows), иначе
+    более далёкие страницы не показываются. Статистика может отставать
+    от таблицы: страница короче полной уточняет число строк, а пустая
+    страница за концом списка пересчитывает его точно.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        count = queryset[:settings.ADMIN_COUNT_LIMIT].count()
+        if count < settings.ADMIN_COUNT_LIMIT or queryset.query.where:
+            return count
+        return max(count, estimate_rows(queryset.model) or 0)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        page = super().page(number)
+        rows = len(page.object_list)
+        if rows < self.per_page:
+            if rows or number == 1:
+                self._set_count((number - 1) * self.per_page + rows)
+            else:
+                self._set_count(self.object_list.count())
+                self.validate_number(number)
+        return page
+
+    def _set_count(self, count):
+        self.__dict__['count'] = count
+        self.__dict__.pop('num_pages', None)
+
+
+ESTIMATE_SQL = {
+    'postgresql': 'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+    'mysql': (
+        'SELECT table_rows FROM information_schema.tables '
+        'WHERE table_schema = DATABASE() AND table_name = %s'
+    ),
+    # Первое число stat - строки в таблице на момент ANALYZE.
+    'sqlite': (
+        'SELECT CAST(stat AS INTEGER) FROM sqlite_stat1 WHERE tbl = %s '
+        'LIMIT 1'
+    ),
+}
+
+
+def estimate_rows(model):
+    """Число строк таблицы model по статистике планировщика БД.
+
+    None, если статистики нет: таблицу ни разу не анализировали или
+    СУБД не поддерживается.
+    """
+    sql = ESTIMATE_SQL.get(connection.vendor)
+    if sql is None:
+        return None
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [model._meta.db_table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class CursorPage(Page):
+    """Страница курсорной пагинации: знает только соседние курсоры."""
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return '<CursorPage of %s objects>' % len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    @property
+    def next_cursor(self):
+        if not self._has_next:
+            return None
+        return encode_cursor(
+            self.object_list[-1], NEXT, self.paginator.key_field)
+
+    @property
+    def previous_cursor(self):
+        if not self._has_previous:
+            return None
+        return encode_cursor(
+            self.object_list[0], PREVIOUS, self.paginator.key_field)
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор по ключу (pub_date, id).
+
+    Не выполняет COUNT и OFFSET: каждая страница выбирается условием
+    по ключу последнего показанного поста, поэтому глубокие страницы
+    стоят столько же, сколько первая. Подклассы меняют ordering -
+    поле ключа и направление, второе поле всегда pk; для ключа не из
+    дат подклассы задают и parse_key.
+    """
+    ordering = ('-pub_date', '-pk')
+    parse_key = staticmethod(parse_datetime)
+
+    @property
+    def key_field(self):
+        return self.ordering[0].lstrip('-')
+
+    def after(self, value, pk, forward=True):
+        """Условие «дальше ключа (value, pk)» в порядке ordering или,
+        при forward=False, в обратном."""
+        descending = self.ordering[0].startswith('-')
+        lookup = 'lt' if descending == forward else 'gt'
+        field = self.key_field
+        return (Q(**{f'{field}__{lookup}': value})
+                | Q(**{field: value, f'pk__{lookup}': pk}))
+
+    def get_page(self, cursor):
+        key = decode_cursor(cursor, self.parse_key)
+        queryset = self.object_list
+        if key is None:
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_next, False)
+        value, pk, direction = key
+        if direction == NEXT:
+            rows = list(
+                queryset.filter(self.after(value, pk))
+                .order_by(*self.ordering)[:self.per_page + 1]
+            )
+            has_next = len(rows) > self.per_page
+            return CursorPage(rows[:self.per_page], self, has_next, True)
+        reverse = [field[1:] if field.startswith('-') else f'-{field}'
+                   for field in self.ordering]
+        rows = list(
+            queryset.filter(self.after(value, pk, forward=False))
+            .order_by(*reverse)[:self.per_page + 1]
+        )
+        if not rows:
+            return self.get_page(None)
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return CursorPage(rows, self, True, has_previous)
+
+
+class CommentCursorPaginator(CursorPaginator):
+    """Комментарии поста в порядке веток (по Comment.path), порциями по
+    курсору."""
+    ordering = ('path', 'pk')
+    parse_key = staticmethod(str)
@@ -0,0 +1,148 @@
+import re
+
+from django.db import connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+# Полнотекстовый индекс SQLite FTS5 по текстам постов и комментариев.
+# Одна строка на пост (rowid = 2 * id) и на комментарий (2 * id + 1),
+# синхронизируется триггерами из миграции 0023_search.
+TABLE = 'posts_search'
+WORD = re.compile(r'\w+')
+# Маркеры подсветки в snippet(): управляющие символы не встречаются в
+# тексте, поэтому его можно экранировать и только потом ставить <mark>.
+MARK_START = '\x02'
+MARK_END = '\x03'
+SNIPPET_TOKENS = 16
+
+REBUILD_SQL = (
+    f'DELETE FROM {TABLE}',
+    f"INSERT INTO {TABLE}(rowid, text, post_id) "
+    f"SELECT id * 2, COALESCE(text, ''), id FROM posts_post",
+    f'INSERT INTO {TABLE}(rowid, text, post_id) '
+    f'SELECT id * 2 + 1, text, post_id FROM posts_comment',
+)
+
+
+def to_match(query):
+    """Запрос FTS5 из пользовательской строки: все слова, каждое как
+    префикс. Операторы FTS5 в строке поиска не действуют."""
+    words = WORD.findall(query)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и выделяет найденные слова тегом <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def post_filter(query):
+    """Условие для Post: текст поста совпадает с query по индексу."""
+    match = to_match(query)
+    if not match:
+        return Q(pk__in=[])
+    return Q(pk__in=RawSQL(
+        f'SELECT post_id FROM {TABLE} '
+        f'WHERE {TABLE} MATCH %s AND rowid = post_id * 2',
+        [match],
+    ))
+
+
+def comment_filter(query):
+    """Условие для Comment: текст комментария совпадает с query."""
+    match = to_match(query)
+    if not match:
+        return Q(pk__in=[])
+    return Q(pk__in=RawSQL(
+        f'SELECT (rowid - 1) / 2 FROM {TABLE} '
+        f'WHERE {TABLE} MATCH %s AND rowid != post_id * 2',
+        [match],
+    ))
+
+
+class SearchResults:
+    """Посты, найденные по query, от более к менее релевантным.
+
+    Ведёт себя как последовательность для Paginator: count() - один
+    запрос к индексу, срез - ещё три (номера постов страницы по
+    рангу, фрагменты с подсветкой, сами посты). У каждого поста
+    страницы post.snippet - лучший совпавший фрагмент его текста или
+    комментария.
+    """
+
+    def __init__(self, query, queryset=None):
+        self.match = to_match(query)
+        self.queryset = Post.objects.all() if queryset is None else (
+            queryset)
+        self._count = None
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.match:
+            return 0
+        if self._count is None:
+            self._count = self._execute(
+                f'SELECT COUNT(DISTINCT post_id) FROM {TABLE} '
+                f'WHERE {TABLE} MATCH %s',
+                [self.match],
+            )[0][0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError('SearchResults поддерживает только срезы')
+        if not self.match:
+            return []
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if stop <= start:
+            return []
+        # rowid рядом с MIN(rank) SQLite берёт из той же строки: это
+        # лучшее совпадение поста, и snippet() считается только для него.
+        rows = self._execute(
+            f'SELECT post_id, rowid, MIN(rank) FROM {TABLE} '
+            f'WHERE {TABLE} MATCH %s '
+            f'GROUP BY post_id ORDER BY MIN(rank) LIMIT %s OFFSET %s',
+            [self.match, stop - start, start],
+        )
+        if not rows:
+            return []
+        ids = [post_id for post_id, _, _ in rows]
+        placeholders = ', '.join(['%s'] * len(rows))
+        snippets = dict(self._execute(
+            f"SELECT post_id, snippet({TABLE}, 0, %s, %s, '…', %s) "
+            f'FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'AND rowid IN ({placeholders})',
+            [MARK_START, MARK_END, SNIPPET_TOKENS, self.match,
+             *(rowid for _, rowid, _ in rows)],
+        ))
+        posts = self.queryset.in_bulk(ids)
+        results = []
+        for post_id in ids:
+            post = posts.get(post_id)
+            if post is not None:
+                post.snippet = highlight(snippets.get(post_id, ''))
+                results.append(post)
+        return results
+
+
+def rebuild():
+    """Заново заполняет индекс по всем постам и комментариям."""
+    with transaction.atomic(), connection.cursor() as cursor:
+        for sql in REBUILD_SQL:
+            cursor.execute(sql)
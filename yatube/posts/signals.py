@@ -0,0 +1,213 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import autocomplete, feed, images, thumbnails, variants
+from .cache import (ALL_PAGES, COMMENT_COUNTS, bump_version, feed_pages,
+                    post_page, user_state)
+from .counters import bump, last_commenter
+from .models import Comment, Follow, Group, Post, Profile
+
+User = get_user_model()
+
+
+USER_CARD_FIELDS = ('username', 'first_name', 'last_name')
+USER_INDEX_FIELDS = USER_CARD_FIELDS + ('is_active',)
+
+
+def touch_posts(**lookup):
+    """Сдвигает Post.modified, сбрасывая закэшированные карточки постов."""
+    Post.objects.filter(**lookup).update(modified=timezone.now())
+    bump_version(ALL_PAGES)
+
+
+@receiver(post_init, sender=User)
+def remember_user_name(sender, instance, **kwargs):
+    """Запоминает имя пользователя, выводимое в карточках его постов."""
+    instance._card_name = tuple(
+        instance.__dict__.get(field) for field in USER_CARD_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    """Заводит профиль со счётчиками для нового пользователя."""
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+def touch_renamed_author_posts(sender, instance, created, raw=False,
+                               **kwargs):
+    name = tuple(getattr(instance, field) for field in USER_CARD_FIELDS)
+    if not created and not raw and name != instance._card_name:
+        touch_posts(author=instance)
+        touch_posts(last_commenter=instance)
+    instance._card_name = name
+
+
+@receiver(post_init, sender=User)
+def remember_user_index(sender, instance, **kwargs):
+    """Запоминает поля пользователя из индекса автодополнения, чтобы не
+    трогать индекс при записи last_login и прочих полей."""
+    instance._indexed = tuple(
+        instance.__dict__.get(field) for field in USER_INDEX_FIELDS)
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, created, raw=False, **kwargs):
+    indexed = tuple(getattr(instance, field) for field in USER_INDEX_FIELDS)
+    if not raw and (created or indexed != instance._indexed):
+        autocomplete.user_changed(instance)
+    instance._indexed = indexed
+
+
+@receiver(post_delete, sender=User)
+def unindex_user(sender, instance, **kwargs):
+    autocomplete.user_deleted(instance)
+
+
+@receiver(post_save, sender=Group)
+def index_group(sender, instance, raw=False, **kwargs):
+    if not raw:
+        autocomplete.group_changed(instance)
+
+
+@receiver(post_delete, sender=Group)
+def unindex_group(sender, instance, **kwargs):
+    autocomplete.group_deleted(instance)
+
+
+@receiver(post_save, sender=Group)
+def touch_group_posts(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        touch_posts(group=instance)
+
+
+@receiver(pre_delete, sender=Group)
+def touch_deleted_group_posts(sender, instance, **kwargs):
+    touch_posts(group=instance)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    """Запоминает группу поста, чтобы при смене перенести счётчик."""
+    instance._counted_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+def count_post_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        bump(Profile, 'posts_count', 1, user_id=instance.author_id)
+        bump(Group, 'posts_count', 1, pk=instance.group_id)
+        feed.fan_out(instance)
+    elif instance._counted_group_id != instance.group_id:
+        bump(Group, 'posts_count', -1, pk=instance._counted_group_id)
+        bump(Group, 'posts_count', 1, pk=instance.group_id)
+    instance._previous_group_id = instance._counted_group_id
+    instance._counted_group_id = instance.group_id
+
+
+@receiver(post_init, sender=Post)
+def remember_post_image(sender, instance, **kwargs):
+    """Запоминает файл картинки поста, чтобы при замене снять ссылку."""
+    image = instance.__dict__.get('image')
+    instance._counted_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Post)
+def count_post_image_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    name = instance.image.name or ''
+    previous = '' if created else instance._counted_image
+    if previous is None or previous == name:
+        return
+    if name:
+        images.acquire(name)
+    if previous:
+        images.release(previous)
+    instance._counted_image = name
+
+
+@receiver(post_save, sender=Post)
+def pregenerate_thumbnails(sender, instance, raw=False, **kwargs):
+    """Готовит миниатюры и варианты для srcset загруженной картинки до
+    первого показа поста."""
+    if instance.image and not raw:
+        thumbnails.schedule(instance.image.name)
+        variants.schedule(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_post_deleted(sender, instance, **kwargs):
+    bump(Profile, 'posts_count', -1, user_id=instance.author_id)
+    bump(Group, 'posts_count', -1, pk=instance.group_id)
+    if instance.image:
+        images.release(instance.image.name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кэш страниц, на которых выводится пост."""
+    if raw:
+        return
+    prefixes = feed_pages(instance.author_id, {
+        instance.group_id, getattr(instance, '_previous_group_id', None)})
+    bump_version(post_page(instance.pk), *prefixes)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1,
+            last_commenter=instance.author_id,
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_comment_deleted(sender, instance, **kwargs):
+    bump(Post, 'comments_count', -1, pk=instance.post_id)
+    Post.objects.filter(pk=instance.post_id).update(
+        last_commenter=last_commenter(Comment))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, raw=False, **kwargs):
+    """Сбрасывает кэш страницы поста и его фрагмента comments_summary в
+    лентах; сами ленты не пересобираются, меняется только их ETag."""
+    if raw:
+        return
+    bump_version(post_page(instance.post_id), COMMENT_COUNTS)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        bump(Profile, 'followers_count', 1, user_id=instance.author_id)
+        bump(Profile, 'following_count', 1, user_id=instance.user_id)
+        feed.sync_mode(instance.author_id)
+        feed.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follower_state(sender, instance, raw=False, **kwargs):
+    """Кнопка подписки и лента подписок меняются только у подписчика."""
+    if not raw:
+        bump_version(user_state(instance.user_id))
+
+
+@receiver(post_delete, sender=Follow)
+def count_follow_deleted(sender, instance, **kwargs):
+    bump(Profile, 'followers_count', -1, user_id=instance.author_id)
+    bump(Profile, 'following_count', -1, user_id=instance.user_id)
+    feed.prune(instance.user_id, instance.author_id)
+    feed.sync_mode(instance.author_id)
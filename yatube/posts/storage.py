@@ -0,0 +1,74 @@
+import hashlib
+import os
+import posixpath
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    """SHA-256 содержимого файла, прочитанного по частям."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def sharded_name(directory, filename, key=None):
+    """Путь directory/ab/cd/filename с двухуровневым префиксом.
+
+    ab и cd - начало md5 от key (по умолчанию от filename), поэтому в
+    каждом каталоге не больше 256 подкаталогов даже при миллионах
+    файлов.
+    """
+    prefix = hashlib.md5((key or filename).encode()).hexdigest()
+    return posixpath.join(directory, prefix[:2], prefix[2:4], filename)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, называющее файлы по хэшу содержимого.
+
+    Одинаковые загрузки получают одно имя и записываются на диск один
+    раз, поэтому их миниатюры и варианты тоже общие. Сколько постов
+    ссылается на файл, учитывает ImageBlob. Файлы раскладываются по
+    подкаталогам upload_to/ab/cd/ (sharded_name).
+    """
+
+    def save(self, name, content, max_length=None):
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.content_name(name, content)
+        with transaction.atomic(savepoint=False):
+            self.reserve(name)
+            if self.exists(name):
+                os.utime(self.path(name))
+                return name
+            return super().save(name, content, max_length)
+
+    def reserve(self, name):
+        """Блокирует строку ImageBlob файла name до конца транзакции.
+
+        Пост, сохраняемый в той же транзакции, возьмёт ссылку на файл, а
+        сборщики (images.collect, collect_media) проверяют ссылки под
+        той же блокировкой и не удаляют файлы, затронутые после начала
+        обхода, поэтому уже лежащий на диске файл не пропадёт между
+        загрузкой и записью поста.
+        """
+        ImageBlob = apps.get_model('posts', 'ImageBlob')
+        ImageBlob.objects.get_or_create(name=name)
+        list(ImageBlob.objects.select_for_update().filter(
+            name=name).values_list('pk', flat=True))
+
+    def content_name(self, name, content):
+        """Имя, под которым content хранится в каталоге из name."""
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return sharded_name(directory, content_hash(content) + extension)
+
+
+image_storage = ContentAddressedStorage()
@@ -0,0 +1,61 @@
+from django.contrib.auth import get_user_model
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from ..models import Comment, Post
+from ..paginators import EstimatedCountPaginator
+from .fixtures.fixture_data import Settings
+
+User = get_user_model()
+
+
+class AdminSearchTests(Settings):
+
+    def setUp(self):
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='admin'))
+
+    def changelist(self, model, query):
+        response = self.admin.get(
+            reverse(f'admin:posts_{model}_changelist'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_search_uses_index(self):
+        """Поиск в админке находит посты и комментарии по словам текста
+        и комментарии по имени автора."""
+        comment = Comment.objects.create(
+            post=self.post, author=self.user2, text='Про ромашки')
+        self.assertEqual(self.changelist('post', 'провер'), [self.post])
+        self.assertEqual(self.changelist('post', 'ромашки'), [])
+        self.assertEqual(self.changelist('comment', 'ромашк'), [comment])
+        self.assertEqual(
+            self.changelist('comment', self.user2.username), [comment])
+
+    @override_settings(ADMIN_COUNT_LIMIT=2)
+    def test_estimated_count(self):
+        """До settings.ADMIN_COUNT_LIMIT строки считаются точно, дальше -
+        по статистике БД; пустая страница за концом уточняет число."""
+        posts = [Post.objects.create(text=f'Пост {i}', author=self.user)
+                 for i in range(3)]
+        posts[0].delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 1)
+        self.assertEqual(paginator.count, 2)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        posts[1].delete()
+        paginator = EstimatedCountPaginator(Post.objects.all(), 1)
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(paginator.num_pages, 3)
+        with self.assertRaises(EmptyPage):
+            paginator.page(3)
+        self.assertEqual(paginator.num_pages, 2)
+        paginator = EstimatedCountPaginator(Post.objects.all(), 10)
+        self.assertEqual(len(paginator.page(1)), 2)
+        self.assertEqual(paginator.num_pages, 1)
+        paginator = EstimatedCountPaginator(
+            Post.objects.filter(author=self.user), 1)
+        self.assertEqual(paginator.count, 2)
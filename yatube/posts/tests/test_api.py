@@ -0,0 +1,124 @@
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+
+from ..models import Comment, Follow, Post
+from .fixtures.fixture_data import Settings
+
+User = get_user_model()
+
+
+class ApiTests(Settings):
+
+    def test_feeds(self):
+        """Ленты отдаются в JSON по курсору с выбранными полями."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        for i in range(12):
+            Post.objects.create(
+                text=f'Пост {i}', author=self.user, group=self.group)
+        urls = (
+            reverse('api:index'),
+            reverse('api:group_posts', kwargs={'slug': self.group.slug}),
+            reverse('api:profile', kwargs={'username': self.user.username}),
+            reverse('api:follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.authorized_client2.get(
+                    url, {'fields': 'id,text,author'})
+                data = response.json()
+                self.assertEqual(len(data['results']), 10)
+                self.assertEqual(
+                    data['results'][0],
+                    {'id': Post.objects.first().pk, 'text': 'Пост 11',
+                     'author': self.user.username})
+                response = self.authorized_client2.get(
+                    url, {'cursor': data['next_cursor'], 'fields': 'id'})
+                self.assertEqual(
+                    [row['id'] for row in response.json()['results']],
+                    list(Post.objects.values_list('pk', flat=True)[10:]))
+
+    def test_post_fields(self):
+        """Все поля поста по умолчанию, неизвестное поле - ошибка 400."""
+        response = self.guest_client.get(reverse('api:index'))
+        post = response.json()['results'][0]
+        self.assertEqual(post['group'], self.group.slug)
+        self.assertEqual(post['image'], self.post.image.url)
+        self.assertEqual(post['comments_count'], 0)
+        response = self.guest_client.get(
+            reverse('api:index'), {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        response = self.guest_client.get(reverse('api:follow_index'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_comments(self):
+        """Комментарии поста идут в порядке веток с глубиной."""
+        first = Comment.objects.create(
+            post=self.post, author=self.user, text='Первый')
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Второй')
+        Comment.objects.create(
+            post=self.post, author=self.user2, text='Ответ', parent=first)
+        response = self.guest_client.get(
+            reverse('api:post_comments', kwargs={'post_id': self.post.pk}),
+            {'fields': 'text,depth,parent'})
+        self.assertEqual(response.json()['results'], [
+            {'text': 'Первый', 'depth': 0, 'parent': None},
+            {'text': 'Ответ', 'depth': 1, 'parent': first.pk},
+            {'text': 'Второй', 'depth': 0, 'parent': None},
+        ])
+
+    def test_etag(self):
+        """Клиент с актуальным ETag получает 304 без выборки страницы,
+        новый пост или правка меняют ETag."""
+        url = reverse('api:index')
+        etag = self.guest_client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный'
+        post.save()
+        edited = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(edited.status_code, 200)
+        Post.objects.create(text='Новый', author=self.user)
+        self.assertNotEqual(self.guest_client.get(url)['ETag'], edited['ETag'])
+
+    def test_follow_etag_follows_subscriptions(self):
+        """Замена одной подписки другой меняет ETag ленты подписок, даже
+        если число подписок и самый новый пост те же."""
+        old_author = User.objects.create_user(username='old_author')
+        new_author = User.objects.create_user(username='new_author')
+        Post.objects.create(text='Старый автор', author=old_author)
+        Post.objects.create(text='Новый автор', author=new_author)
+        Post.objects.create(text='Самый новый', author=self.user)
+        Follow.objects.create(user=self.user2, author=self.user)
+        Follow.objects.create(user=self.user2, author=old_author)
+        url = reverse('api:follow_index')
+        etag = self.authorized_client2.get(url)['ETag']
+        Follow.objects.filter(user=self.user2, author=old_author).delete()
+        Follow.objects.create(user=self.user2, author=new_author)
+        response = self.authorized_client2.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Новый автор', [
+            post['text'] for post in response.json()['results']])
+
+    def test_etag_follows_renames(self):
+        """Переименование автора меняет ETag ленты и комментариев."""
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий')
+        urls = (
+            reverse('api:index'),
+            reverse('api:post_comments', kwargs={'post_id': self.post.pk}),
+        )
+        etags = {url: self.guest_client.get(url)['ETag'] for url in urls}
+        author = User.objects.get(pk=self.user.pk)
+        author.username = 'renamed'
+        author.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=etags[url])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response.json()['results'][0]['author'], 'renamed')
@@ -0,0 +1,105 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.urls import reverse
+
+from .. import autocomplete
+from ..autocomplete import (CHANGE_KEY, SEQUENCE_KEY, PrefixIndex,
+                            get_index, sync, warm)
+from ..models import Group
+from .fixtures.fixture_data import Settings
+
+User = get_user_model()
+
+
+class AutocompleteTests(Settings):
+
+    def setUp(self):
+        cache.clear()
+
+    def suggest(self, query):
+        response = self.guest_client.get(
+            reverse('posts:autocomplete'), {'q': query})
+        return [(item['type'], item['value'])
+                for item in response.json()['results']]
+
+    def test_prefix_lookup(self):
+        """Подсказки по началу имени, slug и названия группы; после
+        построения индекса запросов к БД нет."""
+        get_index()
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.suggest('hasno'), [('user', self.user.username)])
+            self.assertEqual(
+                self.suggest('HAS'),
+                [('user', self.user2.username), ('user', self.user.username)])
+            self.assertEqual(
+                self.suggest('тестовая'),
+                [('group', self.group.slug), ('group', self.group2.slug)])
+            self.assertEqual(self.suggest('test-slug2'),
+                             [('group', self.group2.slug)])
+        response = self.guest_client.get(
+            reverse('posts:autocomplete'), {'q': 'hasno'})
+        self.assertEqual(
+            response.json()['results'][0]['url'],
+            reverse('posts:profile', args=[self.user.username]))
+
+    def test_index_follows_writes(self):
+        """Новые, переименованные и удалённые пользователи и группы
+        видны в подсказках без перестройки индекса."""
+        get_index()
+        user = User.objects.create_user(username='newcomer')
+        group = Group.objects.create(title='Новая', slug='fresh')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('new'), [('user', 'newcomer')])
+            self.assertEqual(self.suggest('fre'), [('group', 'fresh')])
+        group.slug = 'renamed'
+        group.save()
+        user.delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest('fre'), [])
+            self.assertEqual(self.suggest('ren'), [('group', 'renamed')])
+            self.assertEqual(self.suggest('newc'), [])
+
+    def test_login_keeps_index(self):
+        """Запись полей вне индекса (last_login) не сбрасывает его."""
+        get_index()
+        sequence = cache.get(SEQUENCE_KEY)
+        self.client.force_login(self.user)
+        self.assertEqual(cache.get(SEQUENCE_KEY), sequence)
+
+    def test_other_process_applies_changes(self):
+        """Индекс другого процесса дочитывает журнал изменений без
+        запросов к БД, а при потерянной записи строится заново."""
+        other = PrefixIndex()
+        with self.assertNumQueries(2):
+            sync(other)
+        User.objects.create_user(username='newcomer')
+        Group.objects.create(title='Новая', slug='fresh')
+        with self.assertNumQueries(0):
+            sync(other)
+        self.assertEqual(other.search('new', 10)[0][1], 'newcomer')
+        self.assertEqual(other.search('fre', 10)[0][1], 'fresh')
+        user = User.objects.create_user(username='lost')
+        User.objects.create_user(username='later')
+        cache.delete(CHANGE_KEY.format(cache.get(SEQUENCE_KEY) - 1))
+        with self.assertNumQueries(2):
+            sync(other)
+        self.assertEqual(other.search('los', 10)[0][1], user.username)
+
+    def test_cold_index_within_budget(self):
+        """Построение индекса на первом запросе укладывается в бюджет
+        представления."""
+        response = self.guest_client.get(
+            reverse('posts:autocomplete'), {'q': 'hasno'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_warm_builds_index_before_first_request(self):
+        """Индекс, построенный при запуске, отвечает на первый запрос
+        процесса без обращений к БД."""
+        with mock.patch.object(autocomplete, 'index', PrefixIndex()):
+            warm()
+            with self.assertNumQueries(0):
+                self.assertEqual(
+                    self.suggest('hasno'), [('user', self.user.username)])
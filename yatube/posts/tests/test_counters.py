@@ -0,0 +1,97 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, Profile
+from .fixtures.fixture_data import Settings
+
+
+class CountersTests(Settings):
+
+    def assertCounters(self, obj, **expected):
+        obj.refresh_from_db()
+        for field, value in expected.items():
+            with self.subTest(obj=obj, field=field):
+                self.assertEqual(getattr(obj, field), value)
+
+    def test_post_counters(self):
+        """Создание, перенос в другую группу и удаление поста меняют
+        счётчики автора и групп."""
+        profile = self.user.profile
+        self.assertCounters(profile, posts_count=1)
+        self.assertCounters(self.group, posts_count=1)
+        post = Post.objects.create(
+            text='Новый пост', author=self.user, group=self.group)
+        self.assertCounters(profile, posts_count=2)
+        self.assertCounters(self.group, posts_count=2)
+        post.group = self.group2
+        post.save()
+        self.assertCounters(self.group, posts_count=1)
+        self.assertCounters(self.group2, posts_count=1)
+        post.delete()
+        self.assertCounters(profile, posts_count=1)
+        self.assertCounters(self.group2, posts_count=0)
+
+    def test_comment_counter_survives_post_edit(self):
+        """Счётчик комментариев не затирается при редактировании поста."""
+        self.authorized_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': self.post.id}),
+            data={'text': 'Комментарий'},
+        )
+        self.assertCounters(self.post, comments_count=1)
+        self.authorized_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': self.post.id}),
+            data={'text': 'Исправленный пост', 'group': self.group.id},
+        )
+        self.assertCounters(self.post, comments_count=1)
+        Comment.objects.all().delete()
+        self.assertCounters(self.post, comments_count=0)
+
+    def test_last_commenter(self):
+        """Автор последнего комментария обновляется при добавлении и
+        удалении комментариев."""
+        first = Comment.objects.create(
+            post=self.post, author=self.user, text='Первый')
+        self.assertCounters(self.post, last_commenter=self.user)
+        second = Comment.objects.create(
+            post=self.post, author=self.user2, text='Второй')
+        self.assertCounters(self.post, last_commenter=self.user2)
+        second.delete()
+        self.assertCounters(self.post, last_commenter=self.user)
+        first.delete()
+        self.assertCounters(self.post, last_commenter=None)
+
+    def test_follow_counters(self):
+        """Подписка и отписка меняют счётчики обоих пользователей."""
+        self.authorized_client.get(
+            reverse('posts:profile_follow', kwargs={'username': self.user2})
+        )
+        self.assertCounters(self.user.profile, following_count=1)
+        self.assertCounters(self.user2.profile, followers_count=1)
+        self.authorized_client.get(
+            reverse('posts:profile_unfollow', kwargs={'username': self.user2})
+        )
+        self.assertCounters(self.user.profile, following_count=0)
+        self.assertCounters(self.user2.profile, followers_count=0)
+
+    def test_recount_repairs_drift(self):
+        """Команда recount восстанавливает счётчики по данным."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        Profile.objects.update(
+            posts_count=42, followers_count=42, following_count=42)
+        Group.objects.update(posts_count=42)
+        Comment.objects.create(
+            post=self.post, author=self.user2, text='Комментарий')
+        Post.objects.update(comments_count=42, last_commenter=None)
+        call_command('recount', stdout=StringIO())
+        self.assertCounters(
+            self.user.profile,
+            posts_count=1, followers_count=1, following_count=0)
+        self.assertCounters(
+            self.user2.profile,
+            posts_count=0, followers_count=0, following_count=1)
+        self.assertCounters(self.group, posts_count=1)
+        self.assertCounters(self.group2, posts_count=0)
+        self.assertCounters(
+            self.post, comments_count=1, last_commenter=self.user2)
@@ -0,0 +1,99 @@
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from django.urls import reverse
+
+from ..feed import follow_feed
+from ..models import FeedItem, Follow, Post, Profile
+from .fixtures.fixture_data import Settings
+
+User = get_user_model()
+
+
+class FollowFeedTests(Settings):
+
+    def setUp(self):
+        self.PAGE_FOLLOW = reverse('posts:follow_index')
+        self.PAGE_FOLLOW_USER2 = reverse(
+            'posts:profile_follow', kwargs={'username': self.user2})
+        self.PAGE_UNFOLLOW_USER2 = reverse(
+            'posts:profile_unfollow', kwargs={'username': self.user2})
+
+    def test_follow_backfills_and_unfollow_prunes_feed(self):
+        """Подписка наполняет ленту старыми постами автора, отписка
+        очищает её."""
+        old_post = Post.objects.create(text='Старый пост', author=self.user2)
+        self.authorized_client.get(self.PAGE_FOLLOW_USER2)
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.user, post=old_post).exists())
+        self.authorized_client.get(self.PAGE_UNFOLLOW_USER2)
+        self.assertFalse(FeedItem.objects.filter(user=self.user).exists())
+
+    def test_new_post_fanned_out_to_followers(self):
+        """Новый пост попадает в ленту подписчика в порядке публикации."""
+        self.authorized_client.get(self.PAGE_FOLLOW_USER2)
+        first = Post.objects.create(text='Первый', author=self.user2)
+        second = Post.objects.create(text='Второй', author=self.user2)
+        response = self.authorized_client.get(self.PAGE_FOLLOW)
+        self.assertEqual(list(response.context['page_obj']), [second, first])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_popular_author_merged_on_read(self):
+        """Посты авторов сверх порога не пишутся в ленты, а подмешиваются
+        при чтении."""
+        with mock.patch('django.db.transaction.on_commit',
+                        lambda func: func()):
+            self.authorized_client.get(self.PAGE_FOLLOW_USER2)
+        post = Post.objects.create(text='Популярный пост', author=self.user2)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        response = self.authorized_client.get(self.PAGE_FOLLOW)
+        self.assertIn(post, response.context['page_obj'])
+        response = self.authorized_client2.get(self.PAGE_FOLLOW)
+        self.assertNotIn(post, response.context['page_obj'])
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=2,
+                       FEED_FANOUT_RESUME_FOLLOWERS=1, FEED_BATCH_SIZE=1)
+    def test_crossing_threshold_both_ways(self):
+        """Режим переключается в фоне после ответа, с запасом между
+        порогами, и не теряет посты: пропущенные посты дозаполняются при
+        возврате к раздаче."""
+        reader = User.objects.create_user(username='reader')
+        other = User.objects.create_user(username='other')
+        before = Post.objects.create(text='До порога', author=self.user2)
+        with self.capture_jobs() as jobs:
+            for user in (self.user, reader, other):
+                Follow.objects.create(user=user, author=self.user2)
+        self.assertTrue(Profile.objects.get(user=self.user2).fanned_out)
+        self.run_jobs(jobs)
+        self.assertFalse(Profile.objects.get(user=self.user2).fanned_out)
+        self.assertFalse(FeedItem.objects.filter(
+            post__author=self.user2).exists())
+        during = Post.objects.create(text='Выше порога', author=self.user2)
+        self.assertEqual(list(follow_feed(reader)), [during, before])
+        with self.capture_jobs() as jobs:
+            Follow.objects.filter(user=other, author=self.user2).delete()
+        self.assertEqual(jobs, [])
+        with self.capture_jobs() as jobs:
+            Follow.objects.filter(user=self.user, author=self.user2).delete()
+        self.assertFalse(Profile.objects.get(user=self.user2).fanned_out)
+        self.run_jobs(jobs)
+        self.assertTrue(Profile.objects.get(user=self.user2).fanned_out)
+        self.assertCountEqual(
+            FeedItem.objects.filter(user=reader).values_list(
+                'post_id', flat=True),
+            [before.pk, during.pk])
+        self.assertEqual(list(follow_feed(reader)), [during, before])
+        self.assertEqual(list(follow_feed(self.user)), [])
+
+    @contextmanager
+    def capture_jobs(self):
+        """Откладывает фоновые задачи, поставленные после коммита."""
+        jobs = []
+        with mock.patch('django.db.transaction.on_commit', jobs.append):
+            yield jobs
+
+    def run_jobs(self, jobs):
+        for job in jobs:
+            job()
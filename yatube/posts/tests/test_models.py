@@ -1,5 +1,9 @@
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.test import TransactionTestCase
 
+from ..models import Comment, Post
 from .fixtures.fixture_data import Settings
 
 User = get_user_model()
@@ -36,3 +40,18 @@ class PostModelTests(Settings):
             post._meta.get_field('group').help_text,
             'Группа, к которой будет относиться пост'
         )
+
+
+class CommentSaveTests(TransactionTestCase):
+
+    def test_failed_path_update_rolls_back_insert(self):
+        """Сбой при записи пути не оставляет комментарий без path."""
+        user = User.objects.create_user(username='commenter')
+        post = Post.objects.create(text='Пост', author=user)
+        with mock.patch('posts.models.comment_path',
+                        side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                Comment.objects.create(post=post, author=user, text='Текст')
+        self.assertFalse(Comment.objects.exists())
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
@@ -5,9 +5,12 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.paginator import Paginator
-from django.test import Client, TestCase
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from ..counters import recount
 from ..models import Group, Post
 
 User = get_user_model()
@@ -34,6 +37,8 @@ class PaginatorViewsTest(TestCase):
                  author=cls.user) for i in range(NUM_POSTS)
         ]
         posts = Post.objects.bulk_create(posts_list)
+        # bulk_create не вызывает сигналы, счётчики пересчитываем явно
+        recount()
         cls.paginator = Paginator(posts, settings.POSTS_PER_PAGE)
         cls.TEMPLATES_PAGES_NAMES_CONTEXT = (
             reverse('posts:group_list', kwargs={
@@ -65,3 +70,87 @@ class PaginatorViewsTest(TestCase):
 
             self.assertEqual(cnt1, settings.POSTS_PER_PAGE, ERROR_MSG)
             self.assertEqual(cnt2, MODULO_POSTS, ERROR_MSG)
+
+
+@override_settings(CURSOR_PAGINATION=True)
+class CursorPaginatorViewsTest(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='HasNoName')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.guest_client = Client()
+        Post.objects.bulk_create([
+            Post(text=f'Пост {i}', group=cls.group,
+                 author=cls.user) for i in range(NUM_POSTS)
+        ])
+        cls.TEMPLATES_PAGES_NAMES_CONTEXT = (
+            reverse('posts:group_list', kwargs={
+                'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user}),
+            reverse('posts:home'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cache.clear()
+
+    def test_cursor_pages_cover_feed_without_count(self):
+        """Курсорная пагинация проходит всю ленту по порядку и не
+        использует OFFSET."""
+        expected = list(Post.objects.order_by('-pub_date', '-pk'))
+        for reverse_name in self.TEMPLATES_PAGES_NAMES_CONTEXT:
+            cache.clear()
+            seen = []
+            url = reverse_name
+            with CaptureQueriesContext(connection) as queries:
+                while url:
+                    page_obj = self.guest_client.get(url).context['page_obj']
+                    seen.extend(page_obj)
+                    url = (reverse_name + '?cursor=' + page_obj.next_cursor
+                           if page_obj.has_next() else None)
+            with self.subTest(reverse_name=reverse_name):
+                self.assertEqual(seen, expected, ERROR_MSG)
+                self.assertFalse(
+                    any('OFFSET' in query['sql'] for query in queries))
+
+    def test_cursor_previous_page(self):
+        """Ссылка «Предыдущая» возвращает на исходную страницу."""
+        reverse_name = reverse('posts:home')
+        cache.clear()
+        first = self.guest_client.get(reverse_name).context['page_obj']
+        cache.clear()
+        second = self.guest_client.get(
+            reverse_name + '?cursor=' + first.next_cursor
+        ).context['page_obj']
+        cache.clear()
+        back = self.guest_client.get(
+            reverse_name + '?cursor=' + second.previous_cursor
+        ).context['page_obj']
+        self.assertEqual(list(back), list(first))
+        self.assertFalse(back.has_previous())
+
+    def test_broken_cursor_returns_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        cache.clear()
+        response = self.guest_client.get(
+            reverse('posts:home') + '?cursor=broken!')
+        self.assertEqual(
+            len(response.context['page_obj']), settings.POSTS_PER_PAGE)
+
+    def test_cursor_page_without_count(self):
+        """Страница ленты группы с курсором не выполняет COUNT."""
+        page_obj = self.guest_client.get(
+            self.TEMPLATES_PAGES_NAMES_CONTEXT[0]).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(
+                self.TEMPLATES_PAGES_NAMES_CONTEXT[0]
+                + '?cursor=' + page_obj.next_cursor)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries))
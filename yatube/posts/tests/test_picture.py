@@ -1,14 +1,19 @@
 import shutil
 import tempfile
+from hashlib import sha256
+from io import BytesIO
 
+from core.uploads import BoundedUploadHandler
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Group, Post
+from ..storage import sharded_name
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -71,4 +76,98 @@ class PostCreateFormTests(TestCase):
         self.assertTrue(Post.objects.filter(
             text='Пост с картинкой',
             group=self.group.id,
-            image='posts/small.gif').exists())
+            image=sharded_name(
+                'posts', f'{sha256(small_gif).hexdigest()}.gif')).exists())
+
+    def upload(self, content, name='image.png'):
+        return self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'text': 'Пост с картинкой',
+                'image': SimpleUploadedFile(name, content),
+            },
+        )
+
+    def make_image(self, size, image_format='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size).save(buffer, image_format)
+        return buffer.getvalue()
+
+    def test_upload_limits(self):
+        """Слишком большие файлы, картинки и форматы отклоняются с
+        ошибкой формы."""
+        cases = (
+            ('too_large', b'\0' * 1000, 'image.png'),
+            ('too_many_pixels', self.make_image((40, 30)), 'image.png'),
+            ('format', self.make_image((10, 10), 'BMP'), 'image.bmp'),
+            ('invalid_image', b'not an image', 'image.png'),
+        )
+        for code, content, name in cases:
+            with self.subTest(code=code), override_settings(
+                    UPLOAD_MAX_SIZE=500, IMAGE_MAX_PIXELS=1000):
+                response = self.upload(content, name)
+                error = response.context['form'].errors.as_data()['image'][0]
+                self.assertEqual(error.code, code)
+        self.assertFalse(Post.objects.exists())
+
+    def test_upload_streams_to_temporary_file(self):
+        """Даже небольшая загрузка пишется во временный файл, а не в
+        память."""
+        handler = BoundedUploadHandler()
+        handler.new_file('image', 'image.png', 'image/png', 3)
+        handler.receive_data_chunk(b'png', 0)
+        uploaded = handler.file_complete(3)
+        self.assertTrue(uploaded.temporary_file_path())
+        uploaded.close()
+
+    @override_settings(UPLOAD_MAX_SIZE=500)
+    def test_upload_discarded_at_limit(self):
+        """Части файла сверх UPLOAD_MAX_SIZE не записываются, а вместо
+        файла форма получает пустую RejectedUpload."""
+        handler = BoundedUploadHandler()
+        handler.new_file('image', 'image.png', 'image/png', None)
+        handler.receive_data_chunk(b'\0' * 400, 0)
+        self.assertIsNone(handler.receive_data_chunk(b'\0' * 400, 400))
+        self.assertTrue(handler.file.closed)
+        uploaded = handler.file_complete(800)
+        self.assertTrue(uploaded.exceeds_limit)
+        self.assertEqual(uploaded.size, 800)
+
+    @override_settings(UPLOAD_MAX_SIZE=500)
+    def test_oversized_upload_keeps_other_fields(self):
+        """Слишком большой файл даёт ошибку формы, а поля после него в
+        теле запроса не теряются."""
+        response = self.authorized_client.post(
+            reverse('posts:post_create'),
+            data={
+                'image': SimpleUploadedFile('image.png', b'\0' * 1000),
+                'text': 'Текст после файла',
+            },
+        )
+        form = response.context['form']
+        self.assertEqual(form.errors.as_data()['image'][0].code, 'too_large')
+        self.assertEqual(form.data['text'], 'Текст после файла')
+
+    @override_settings(UPLOAD_MAX_SIZE=500)
+    def test_admin_rejects_oversized_upload(self):
+        """Админка показывает ошибку размера и оставляет прежнюю
+        картинку."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass')
+        post = Post.objects.create(
+            text='Пост', author=self.user, image='posts/old.gif')
+        client = Client()
+        client.force_login(admin)
+        response = client.post(
+            reverse('admin:posts_post_change', args=[post.pk]),
+            data={
+                'text': 'Пост', 'author': self.user.pk,
+                'pub_date_0': '2022-01-01', 'pub_date_1': '00:00:00',
+                'image': SimpleUploadedFile('image.png', b'\0' * 1000),
+            },
+        )
+        self.assertEqual(response.status_code, 200)
+        error = response.context['adminform'].form.errors.as_data()
+        self.assertEqual(error['image'][0].code, 'too_large')
+        post.refresh_from_db()
+        self.assertEqual(post.image.name, 'posts/old.gif')
@@ -0,0 +1,50 @@
+from core.query_budget import QueryBudgetExceeded, query_budget
+from django.http import HttpResponse
+from django.test import override_settings
+from django.urls import path
+
+from ..models import Post
+from .fixtures.fixture_data import Settings
+
+
+@query_budget(20)
+def posts_with_authors(request):
+    """View с N+1: автор каждого поста подгружается отдельным запросом."""
+    names = [post.author.username for post in Post.objects.all()]
+    return HttpResponse(', '.join(names))
+
+
+@query_budget(1)
+def over_budget(request):
+    list(Post.objects.all())
+    list(Post.objects.filter(group__isnull=False))
+    return HttpResponse()
+
+
+urlpatterns = [
+    path('n-plus-one/', posts_with_authors),
+    path('over-budget/', over_budget),
+]
+
+
+@override_settings(
+    ROOT_URLCONF='posts.tests.test_query_budget', QUERY_BUDGET_RAISE=True)
+class QueryBudgetTests(Settings):
+
+    def test_n_plus_one_detected(self):
+        """Повтор одного и того же запроса для каждого поста - ошибка."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.user2) for i in range(5))
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'N+1'):
+            self.guest_client.get('/n-plus-one/')
+
+    def test_budget_exceeded(self):
+        """Превышение заявленного числа запросов - ошибка."""
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'бюджете 1'):
+            self.guest_client.get('/over-budget/')
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_budget_exceeded_logged_in_production(self):
+        """Без QUERY_BUDGET_RAISE превышение только пишется в лог."""
+        with self.assertLogs('core.query_budget', 'WARNING'):
+            self.guest_client.get('/over-budget/')
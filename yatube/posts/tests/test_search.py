@@ -0,0 +1,81 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Post
+from ..search import TABLE, SearchResults
+from .fixtures.fixture_data import Settings
+
+
+class SearchTests(Settings):
+
+    def search(self, query):
+        return [post.pk for post in SearchResults(query)[:10]]
+
+    def test_search_view_ranks_posts_and_comments(self):
+        """Поиск находит посты по тексту и комментариям, лучшие
+        совпадения выше, найденные слова подсвечены и экранированы."""
+        weak = Post.objects.create(
+            text='Про котов и собак', author=self.user)
+        strong = Post.objects.create(
+            text='Коты, коты, снова коты <b>', author=self.user)
+        commented = Post.objects.create(text='Без слова', author=self.user)
+        Comment.objects.create(
+            post=commented, author=self.user2, text='А у меня котёнок')
+        Post.objects.create(text='Ничего общего', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.guest_client.get(
+                reverse('posts:search'), {'q': 'кот'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0], strong)
+        self.assertCountEqual(page_obj[1:], [weak, commented])
+        self.assertLessEqual(len(queries), 6)
+        self.assertContains(response, '<mark>Коты</mark>')
+        self.assertContains(response, '&lt;b&gt;')
+        self.assertEqual(self.search('котёнок'), [commented.pk])
+
+    def test_snippet_from_best_match(self):
+        """Фрагмент поста берётся из лучшего совпадения: поста или
+        одного из его комментариев."""
+        post = Post.objects.create(
+            text='Длинный рассказ о разном, где слон упомянут один раз '
+                 'среди множества других слов и подробностей',
+            author=self.user)
+        Comment.objects.create(post=post, author=self.user2, text='Слон')
+        for i in range(3):
+            Comment.objects.create(
+                post=post, author=self.user2, text=f'Слоны {i}')
+        results = SearchResults('слон')[:10]
+        self.assertEqual(results, [post])
+        self.assertEqual(results[0].snippet, '<mark>Слон</mark>')
+
+    def test_index_follows_edits(self):
+        """Триггеры обновляют индекс при правке и удалении."""
+        post = Post.objects.create(text='Первоначальный', author=self.user)
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text='Комментарий-ромашка')
+        self.assertEqual(self.search('ромашка'), [self.post.pk])
+        post.text = 'Исправленный'
+        post.save()
+        self.assertEqual(self.search('Первоначальный'), [])
+        self.assertEqual(self.search('Исправленный'), [post.pk])
+        comment.delete()
+        post.delete()
+        self.assertEqual(self.search('ромашка'), [])
+        self.assertEqual(self.search('Исправленный'), [])
+
+    def test_query_syntax_is_not_interpreted(self):
+        """Операторы FTS5 и кавычки в строке поиска не ломают запрос."""
+        self.assertEqual(self.search('"Пост" (провер* -'), [self.post.pk])
+        self.assertEqual(self.search('!!!'), [])
+
+    def test_rebuild_search(self):
+        """Команда rebuild_search восстанавливает индекс."""
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {TABLE}')
+        self.assertEqual(self.search('проверка'), [])
+        call_command('rebuild_search', stdout=StringIO())
+        self.assertEqual(self.search('проверка'), [self.post.pk])
@@ -0,0 +1,62 @@
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+
+from ..models import Comment
+from .fixtures.fixture_data import Settings
+
+
+@override_settings(SHARED_PAGE_CACHE=True)
+class SharedPageCacheTests(Settings):
+
+    def setUp(self):
+        cache.clear()
+        self.PAGE_PROFILE2 = reverse(
+            'posts:profile', kwargs={'username': self.user2})
+        self.PAGE_DETAIL = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.id})
+
+    def test_personal_fragments_filled_after_cache(self):
+        """Общая копия страницы дополняется фрагментами каждого
+        пользователя."""
+        guest = self.guest_client.get(self.PAGE_PROFILE2)
+        self.assertNotContains(guest, 'Пользователь:')
+        self.assertNotContains(guest, 'Подписаться')
+        response = self.authorized_client.get(self.PAGE_PROFILE2)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, f'Пользователь: {self.user.username}')
+        self.assertContains(response, 'Подписаться')
+        self.assertNotContains(response, '<!--fragment:')
+
+    def test_post_detail_personal_parts(self):
+        """Кнопка редактирования и форма комментария видны только тем,
+        кому они положены."""
+        self.guest_client.get(self.PAGE_DETAIL)
+        author = self.authorized_client.get(self.PAGE_DETAIL)
+        self.assertContains(author, 'редактировать запись')
+        self.assertContains(author, 'csrfmiddlewaretoken')
+        other = self.authorized_client2.get(self.PAGE_DETAIL)
+        self.assertNotContains(other, 'редактировать запись')
+        self.assertContains(other, 'csrfmiddlewaretoken')
+        guest = self.guest_client.get(self.PAGE_DETAIL)
+        self.assertNotContains(guest, 'csrfmiddlewaretoken')
+
+    def test_new_comment_invalidates_post_page(self):
+        """Новый комментарий сразу появляется на закэшированной
+        странице поста."""
+        self.guest_client.get(self.PAGE_DETAIL)
+        Comment.objects.create(
+            text='Свежий комментарий', post=self.post, author=self.user2)
+        self.assertContains(
+            self.guest_client.get(self.PAGE_DETAIL), 'Свежий комментарий')
+
+    def test_new_comment_updates_cached_feed(self):
+        """Счётчик комментариев в общей копии ленты обновляется без её
+        пересборки."""
+        page = reverse('posts:profile', kwargs={'username': self.user})
+        self.guest_client.get(page)
+        Comment.objects.create(
+            text='Комментарий', post=self.post, author=self.user2)
+        response = self.guest_client.get(page)
+        self.assertTemplateNotUsed(response, 'posts/profile.html')
+        self.assertContains(response, 'Комментариев: 1')
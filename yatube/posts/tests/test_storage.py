@@ -0,0 +1,145 @@
+import io
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from PIL import Image
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from ..images import collect
+from ..models import ImageBlob, ImageVariant, Post
+from ..storage import image_storage
+from ..variants import build_variants, variant_name
+from .fixtures.fixture_data import Settings
+
+
+class ContentAddressedStorageTests(Settings):
+
+    def create_post(self, content, name='meme.png'):
+        return Post.objects.create(
+            text='Мем', author=self.user,
+            image=SimpleUploadedFile(name, content),
+        )
+
+    def refs(self, name):
+        return ImageBlob.objects.get(name=name).refs
+
+    def test_same_content_stored_once(self):
+        """Одинаковые загрузки получают один файл и общий счётчик
+        ссылок, а файл удаляется вместе с последней ссылкой."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300), 'blue').save(buffer, 'PNG')
+        first = self.create_post(buffer.getvalue())
+        second = self.create_post(buffer.getvalue(), name='copy.PNG')
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertRegex(
+            name, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertEqual(self.refs(name), 2)
+
+        first.delete()
+        self.assertFalse(collect(name))
+        self.assertTrue(image_storage.exists(name))
+        second.image = self.post.image.name
+        second.save()
+        self.assertEqual(self.refs(name), 0)
+        self.assertEqual(self.refs(self.post.image.name), 2)
+        self.assertTrue(collect(name))
+        self.assertFalse(image_storage.exists(name))
+        self.assertFalse(ImageBlob.objects.filter(name=name).exists())
+
+    def test_reupload_keeps_unreferenced_file(self):
+        """Повторная загрузка файла без ссылок обновляет его mtime, и
+        сборщики не удаляют его до записи поста."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300), 'yellow').save(buffer, 'PNG')
+        post = self.create_post(buffer.getvalue())
+        name = post.image.name
+        post.delete()
+        self.assertEqual(self.refs(name), 0)
+        path = image_storage.path(name)
+        os.utime(path, (0, 0))
+        self.assertEqual(
+            image_storage.save('posts/again.png',
+                               ContentFile(buffer.getvalue())),
+            name)
+        self.assertGreater(os.path.getmtime(path), 0)
+        call_command('collect_media', min_age=60, stdout=io.StringIO())
+        self.assertTrue(image_storage.exists(name))
+        self.create_post(buffer.getvalue())
+        self.assertFalse(collect(name))
+        self.assertTrue(image_storage.exists(name))
+        self.assertEqual(self.refs(name), 1)
+
+    def test_variants_shared(self):
+        """Варианты одинаковой картинки кодируются один раз."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300), 'green').save(buffer, 'PNG')
+        first = self.create_post(buffer.getvalue())
+        second = self.create_post(buffer.getvalue())
+        build_variants(first.pk)
+        build_variants(second.pk)
+        files = ImageVariant.objects.values_list('post', 'file')
+        self.assertEqual(
+            {file for post, file in files if post == first.pk},
+            {file for post, file in files if post == second.pk},
+        )
+
+    def test_shard_media_command(self):
+        """Команда переносит старые файлы в подкаталоги, переписывает
+        пути постов, вариантов и счётчики ссылок."""
+        buffer = io.BytesIO()
+        Image.new('RGB', (600, 300), 'red').save(buffer, 'PNG')
+        old = 'posts/legacy.png'
+        image_storage._save(old, ContentFile(buffer.getvalue()))
+        post = Post.objects.create(text='Старый пост', author=self.user,
+                                   image=old)
+        build_variants(post.pk)
+        call_command('shard_media', batch_size=1, stdout=io.StringIO())
+
+        post.refresh_from_db()
+        new = post.image.name
+        self.assertRegex(
+            new, r'^posts/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}\.png$')
+        self.assertTrue(image_storage.exists(new))
+        self.assertFalse(image_storage.exists(old))
+        self.assertEqual(self.refs(new), 1)
+        self.assertFalse(ImageBlob.objects.filter(name=old).exists())
+        variant = post.image_variants.first()
+        self.assertEqual(variant.source, new)
+        self.assertEqual(variant.file.name,
+                         variant_name(new, variant.width, variant.format))
+        self.assertTrue(variant.file.storage.exists(variant.file.name))
+        self.assertFalse(variant.file.storage.exists(
+            variant_name(old, variant.width, variant.format)))
+
+    def test_collect_media_command(self):
+        """Сборщик удаляет файлы без ссылок и записи sorl о пропавших
+        файлах; с --dry-run только показывает их."""
+        variant_storage = ImageVariant._meta.get_field('file').storage
+        orphans = (
+            (image_storage, 'posts/00/00/orphan.gif'),
+            (variant_storage, variant_name('posts/orphan.gif', 480, 'webp')),
+            (default.storage, 'cache/00/00/orphan.jpg'),
+        )
+        for storage, name in orphans:
+            storage._save(name, ContentFile(self.small_gif))
+        stale = ImageFile('posts/missing.gif', image_storage)
+        stale.set_size((2, 1))
+        default.kvstore.set(stale)
+
+        out = io.StringIO()
+        call_command('collect_media', dry_run=True, min_age=0, stdout=out)
+        self.assertIn('картинок 1, вариантов 1, миниатюр 1', out.getvalue())
+        self.assertIn('записей sorl 1', out.getvalue())
+        for storage, name in orphans:
+            self.assertTrue(storage.exists(name))
+
+        call_command('collect_media', min_age=0, stdout=io.StringIO())
+        for storage, name in orphans:
+            with self.subTest(name=name):
+                self.assertFalse(storage.exists(name))
+        self.assertIsNone(default.kvstore.get(stale))
+        self.assertTrue(image_storage.exists(self.post.image.name))
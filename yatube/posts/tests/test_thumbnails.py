@@ -0,0 +1,121 @@
+import threading
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import override_settings
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+from ..cache import (ALL_PAGES, INDEX_PAGE, get_version, group_page,
+                     post_page, profile_page)
+from ..models import Post
+from .. import thumbnails
+from ..thumbnails import (THUMBNAILS, PregeneratedThumbnailBackend,
+                          generate_thumbnails, preload_thumbnails,
+                          run_in_background)
+from .fixtures.fixture_data import Settings
+
+
+class ThumbnailPregenerationTests(Settings):
+
+    def setUp(self):
+        cache.clear()
+
+    def store_thumbnail(self, image):
+        geometry, options = THUMBNAILS[0]
+        thumbnail = PregeneratedThumbnailBackend().thumbnail(
+            ImageFile(image), geometry, options)
+        thumbnail.set_size((960, 339))
+        default.kvstore.set(thumbnail)
+        return thumbnail
+
+    def test_template_backend_does_not_resize(self):
+        """Без готовой миниатюры отдаётся исходная картинка, а готовая
+        берётся из хранилища без постановки в очередь."""
+        geometry, options = THUMBNAILS[0]
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            image = get_thumbnail(self.post.image, geometry, **options)
+        self.assertEqual(image.name, self.post.image.name)
+        schedule.assert_called_once_with(self.post.image.name)
+
+        thumbnail = self.store_thumbnail(self.post.image)
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            image = get_thumbnail(self.post.image, geometry, **options)
+        self.assertEqual(image.name, thumbnail.name)
+        self.assertEqual((image.width, image.height), (960, 339))
+        schedule.assert_not_called()
+
+    def test_upload_schedules_thumbnails(self):
+        """Сохранение поста с картинкой ставит миниатюры в очередь."""
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            post = Post.objects.create(
+                text='Пост с картинкой', author=self.user,
+                image=self.post.image.name)
+        schedule.assert_called_once_with(post.image.name)
+
+    def test_generated_thumbnail_resets_only_its_pages(self):
+        """Готовая миниатюра сбрасывает страницы постов с картинкой и
+        лент с их карточками, остальные страницы остаются в кэше."""
+        own = [ALL_PAGES, INDEX_PAGE, post_page(self.post.pk),
+               profile_page(self.user.username), group_page(self.group.slug)]
+        other = [profile_page(self.user2.username),
+                 group_page(self.group2.slug)]
+        before = {prefix: get_version(prefix) for prefix in own + other}
+        with mock.patch.object(PregeneratedThumbnailBackend,
+                               'get_thumbnail'):
+            generate_thumbnails(self.post.image.name)
+        changed = {prefix for prefix in before
+                   if get_version(prefix) != before[prefix]}
+        self.assertEqual(changed, set(own) - {ALL_PAGES})
+
+    @override_settings(THUMBNAIL_WORKERS=2)
+    def test_background_jobs_run_in_pool(self):
+        """С THUMBNAIL_WORKERS > 0 задача выполняется в пуле потоков,
+        повторная с тем же lock пропускается, пока первая не
+        закончилась."""
+        started = threading.Event()
+        release = threading.Event()
+        threads = []
+
+        def job(name):
+            threads.append((threading.current_thread().name, name))
+            started.set()
+            release.wait(5)
+
+        with mock.patch.object(thumbnails, '_executor', None), \
+                mock.patch('django.db.transaction.on_commit',
+                           lambda func: func()):
+            run_in_background('test:lock', job, 'first')
+            self.assertTrue(started.wait(5))
+            run_in_background('test:lock', job, 'second')
+            release.set()
+            thumbnails.get_executor().shutdown(wait=True)
+        self.assertEqual(len(threads), 1)
+        thread_name, name = threads[0]
+        self.assertTrue(thread_name.startswith('thumbnails'))
+        self.assertEqual(name, 'first')
+        self.assertIsNone(cache.get('test:lock'))
+
+    def test_preload_page_in_one_lookup(self):
+        """Миниатюры страницы постов загружаются одним запросом к БД,
+        а повторно - только из кэша."""
+        thumbnail = self.store_thumbnail(self.post.image)
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.user,
+                 image=f'posts/other{i}.gif')
+            for i in range(5)
+        )
+        cache.clear()
+        posts = list(Post.objects.all())
+        with mock.patch('posts.thumbnails.schedule') as schedule:
+            with self.assertNumQueries(1):
+                preload_thumbnails(posts)
+        self.assertEqual(schedule.call_count, 5)
+        with mock.patch('posts.thumbnails.schedule'):
+            with self.assertNumQueries(0):
+                preload_thumbnails(posts)
+        by_pk = {post.pk: post for post in posts}
+        self.assertEqual(by_pk[self.post.pk].thumbnail.name, thumbnail.name)
+        self.assertEqual(by_pk[self.post.pk].thumbnail.width, 960)
+        other = Post.objects.get(text='Пост 0')
+        self.assertEqual(by_pk[other.pk].thumbnail.name, other.image.name)
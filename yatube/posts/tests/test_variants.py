@@ -0,0 +1,65 @@
+import io
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.urls import reverse
+from PIL import Image
+
+from ..cache import get_version, group_page, post_page
+from ..models import ImageVariant, Post
+from ..variants import build_variants
+from .fixtures.fixture_data import Settings
+
+
+class ImageVariantsTests(Settings):
+
+    def create_post(self, size=(1200, 600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return Post.objects.create(
+            text='Пост с большой картинкой', author=self.user,
+            image=SimpleUploadedFile('big.png', buffer.getvalue()),
+        )
+
+    def test_variants_built_once(self):
+        """Картинка кодируется в WebP и JPEG всех ширин не больше
+        исходной, повторный запуск ничего не пересоздаёт."""
+        post = self.create_post()
+        versions = [get_version(post_page(post.pk)),
+                    get_version(group_page(self.group.slug))]
+        build_variants(post.pk)
+        self.assertNotEqual(get_version(post_page(post.pk)), versions[0])
+        self.assertEqual(get_version(group_page(self.group.slug)),
+                         versions[1])
+        variants = list(post.image_variants.values_list(
+            'format', 'width', 'height'))
+        self.assertEqual(variants, [
+            ('jpeg', 480, 170), ('jpeg', 960, 339),
+            ('webp', 480, 170), ('webp', 960, 339),
+        ])
+        webp = post.image_variants.get(format='webp', width=480)
+        with webp.file.open('rb') as file:
+            self.assertEqual(Image.open(file).format, 'WEBP')
+        modified = Post.objects.get(pk=post.pk).modified
+        self.assertGreater(modified, post.modified)
+        build_variants(post.pk)
+        self.assertEqual(
+            list(post.image_variants.values_list('pk', flat=True)),
+            list(ImageVariant.objects.filter(
+                post=post).values_list('pk', flat=True)),
+        )
+        self.assertEqual(Post.objects.get(pk=post.pk).modified, modified)
+
+    def test_pages_render_srcset(self):
+        """Лента и страница поста выводят srcset из записанных
+        вариантов."""
+        post = self.create_post()
+        build_variants(post.pk)
+        webp = post.image_variants.get(format='webp', width=960)
+        for url in (
+            reverse('posts:home'),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        ):
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'type="image/webp"')
+                self.assertContains(response, f'{webp.file.url} 960w')
@@ -1,10 +1,19 @@
+import time
+from unittest import mock
+
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
+from django.db import connection
 from django.shortcuts import get_object_or_404
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import http_date
 
-from ..models import Comment, Follow, Post
+from ..cache import (ALL_PAGES, INDEX_PAGE, bump_version, get_version,
+                     group_page, page_key, profile_page, version_time)
+from ..models import Comment, Follow, Group, Post
 from .fixtures.fixture_data import Settings
 
 User = get_user_model()
@@ -66,7 +75,7 @@ class PostViewsTests(Settings):
                 self.assertEqual(post_text, self.post.text)
                 self.assertEqual(post_group, self.post.group.title)
                 self.assertEqual(post_author, self.user.username)
-                self.assertEqual(post_image, 'posts/small.gif')
+                self.assertEqual(post_image, self.post.image.name)
 
     def test_post_detail_page_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
@@ -78,7 +87,7 @@ class PostViewsTests(Settings):
         self.assertEqual(
             response.context['post'].author.username, self.user.username)
         self.assertEqual(
-            response.context['post'].image, 'posts/small.gif')
+            response.context['post'].image, self.post.image.name)
 
     def test_edit_post_get_correct_contex(self):
         """Шаблон post_edit сформирован с правильным контекстом."""
@@ -126,6 +135,78 @@ class PostViewsTests(Settings):
             comment, response, 'Коммента нет'
         )
 
+    @override_settings(COMMENTS_PER_PAGE=3)
+    def test_comments_loaded_by_cursor(self):
+        """На странице поста первые комментарии, остальные подгружаются
+        по курсору; счётчик берётся из поста."""
+        post = Post.objects.get(pk=self.post.pk)
+        Comment.objects.bulk_create(
+            Comment(text=f'Комментарий {i}', post=post, author=self.user)
+            for i in range(5)
+        )
+        Post.objects.filter(pk=post.pk).update(comments_count=5)
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(
+            [comment.text for comment in comments],
+            ['Комментарий 0', 'Комментарий 1', 'Комментарий 2'])
+        self.assertContains(response, 'Комментарии (5)')
+        self.assertTrue(comments.has_next())
+        response = self.guest_client.get(
+            reverse('posts:post_comments', kwargs={'post_id': post.pk}),
+            {'cursor': comments.next_cursor, 'partial': 1},
+        )
+        self.assertTemplateNotUsed(response, 'base.html')
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            ['Комментарий 3', 'Комментарий 4'])
+        self.assertNotContains(response, 'data-more-comments')
+
+    def test_comment_replies_threaded(self):
+        """Ответы выводятся сразу под родителем с отступом, ветка
+        загружается одним запросом."""
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        other = Post.objects.create(text='Другой пост', author=self.user)
+        foreign = Comment.objects.create(
+            post=other, author=self.user, text='Чужой')
+        for text, parent in (('Первый', None), ('Второй', None),
+                             ('Ответ на первый', 'Первый'),
+                             ('Ответ на ответ', 'Ответ на первый')):
+            data = {'text': text}
+            if parent:
+                data['parent'] = Comment.objects.get(text=parent).pk
+            self.authorized_client.post(url, data)
+        self.authorized_client.post(
+            url, {'text': 'Не к этому посту', 'parent': foreign.pk})
+        response = self.guest_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = list(response.context['comments'])
+        self.assertEqual(
+            [(comment.text, comment.depth) for comment in comments],
+            [('Первый', 0), ('Ответ на первый', 1), ('Ответ на ответ', 2),
+             ('Второй', 0), ('Не к этому посту', 0)])
+        with self.assertNumQueries(1):
+            subtree = list(comments[0].subtree())
+        self.assertEqual(subtree, comments[:3])
+
+    def test_add_comment_ajax(self):
+        """AJAX-отправка комментария возвращает только его разметку,
+        ошибки формы - в JSON."""
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        ajax = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        response = self.authorized_client.post(
+            url, {'text': 'Быстрый комментарий'}, **ajax)
+        self.assertEqual(response.status_code, 201)
+        self.assertTemplateUsed(response, 'posts/includes/comment.html')
+        self.assertTemplateNotUsed(response, 'base.html')
+        comment = Comment.objects.get(text='Быстрый комментарий')
+        self.assertContains(
+            response, f'id="comment-{comment.pk}"', status_code=201)
+        response = self.authorized_client.post(url, {'text': ''}, **ajax)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('text', response.json()['errors'])
+
     def test_post_added_with_group_not_in_wrong_group(self):
         """Проверка, что созданный пост не попал в группу, для которой не был
         предназначен."""
@@ -151,9 +232,25 @@ class PostViewsTests(Settings):
     def test_cache_index(self):
         """Проверка хранения и очищения кэша для index."""
         posts = self.authorized_client.get('/').content
-        Post.objects.all().delete()
+        Post.objects.update(text='Изменено в обход сигналов')
         posts2 = self.authorized_client.get('/').content
         self.assertEqual(posts2, posts)
+        Post.objects.all().delete()
+        posts3 = self.authorized_client.get('/').content
+        self.assertNotEqual(posts3, posts)
+
+    def test_cache_index_single_flight(self):
+        """Пока страницу пересобирает другой запрос, отдаётся предыдущая
+        версия."""
+        posts = self.authorized_client.get('/').content
+        Post.objects.create(text='Новый пост', author=self.user)
+        request = RequestFactory().get('/')
+        request.user = self.user
+        cache.add(
+            f'{page_key(INDEX_PAGE, request)}:'
+            f'{get_version(ALL_PAGES, INDEX_PAGE)}:lock', 1
+        )
+        self.assertEqual(self.authorized_client.get('/').content, posts)
 
     def test_authorized_user_follow_unfollow(self):
         """Авторизованный пользователь может подписываться на других
@@ -188,3 +285,163 @@ class PostViewsTests(Settings):
         )
         self.assertIn(new_post, response.context['page_obj'])
         self.assertNotIn(new_post, response2.context['page_obj'])
+
+    def test_feed_cards_show_comments(self):
+        """Карточки в лентах показывают число комментариев и автора
+        последнего, не добавляя запросов на каждый пост."""
+        Follow.objects.create(user=self.user2, author=self.user)
+        pages = self.TEMPLATES_PAGES_NAMES_CONTEXT + (
+            reverse('posts:follow_index'),)
+        Comment.objects.create(
+            post=self.post, author=self.user2, text='Комментарий')
+
+        def count_queries(page):
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.authorized_client2.get(page)
+            return response, len(queries)
+
+        counts = {page: count_queries(page)[1] for page in pages}
+        for i in range(3):
+            post = Post.objects.create(
+                text=f'Пост {i}', author=self.user, group=self.group)
+            Comment.objects.create(
+                post=post, author=self.user, text='Комментарий')
+        for page in pages:
+            with self.subTest(page=page):
+                response, count = count_queries(page)
+                self.assertEqual(count, counts[page])
+                self.assertContains(response, 'Комментариев: 1', count=4)
+                self.assertContains(
+                    response, f'>{self.user2.username}</a>', count=1)
+
+    def test_comment_refreshes_only_card_summary(self):
+        """Комментарий не сбрасывает кэш лент: в закэшированной ленте
+        обновляется только фрагмент счётчика, а ETag меняется."""
+        page = reverse('posts:home')
+        prefixes = (INDEX_PAGE, group_page(self.group.slug),
+                    profile_page(self.user.username))
+        response = self.authorized_client2.get(page)
+        self.assertContains(response, 'Комментариев: 0')
+        versions = get_version(*prefixes)
+        Comment.objects.create(
+            post=self.post, author=self.user2, text='Комментарий')
+        self.assertEqual(get_version(*prefixes), versions)
+        fresh = self.authorized_client2.get(
+            page, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertTemplateNotUsed(fresh, 'posts/index.html')
+        self.assertContains(fresh, 'Комментариев: 1')
+        self.assertContains(fresh, f'>{self.user2.username}</a>')
+        self.assertNotContains(fresh, '<!--fragment:')
+
+    def test_card_summary_follows_commenter_rename(self):
+        """Новое имя последнего комментатора видно в закэшированной
+        ленте."""
+        page = reverse('posts:home')
+        commenter = User.objects.create_user(username='commenter')
+        Comment.objects.create(
+            post=self.post, author=commenter, text='Комментарий')
+        self.assertContains(self.guest_client.get(page), '>commenter</a>')
+        commenter.first_name = 'Новое'
+        commenter.last_name = 'Имя'
+        commenter.save()
+        response = self.guest_client.get(page)
+        self.assertContains(response, '>Новое Имя</a>')
+
+    def test_conditional_get(self):
+        """Страницы отвечают 304 по ETag и Last-Modified без запросов к
+        БД, пока их не изменили."""
+        page = reverse('posts:home')
+        with mock.patch('time.time', return_value=time.time() + 2):
+            response = self.guest_client.get(page)
+            etag, last_modified = response['ETag'], response['Last-Modified']
+            with self.assertNumQueries(0):
+                response = self.guest_client.get(
+                    page, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            response = self.guest_client.get(
+                page, HTTP_IF_MODIFIED_SINCE=last_modified)
+            self.assertEqual(response.status_code, 304)
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.guest_client.get(page, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый пост')
+
+    def test_last_modified_waits_for_full_second(self):
+        """Пока не прошла секунда последнего сдвига версии, Last-Modified
+        не отправляется и If-Modified-Since не даёт 304: сдвиг в ту же
+        секунду не должен отдать устаревшую страницу."""
+        page = reverse('posts:home')
+        self.guest_client.get(page)
+        bump_version(INDEX_PAGE)
+        bumped = version_time(get_version(INDEX_PAGE))
+        with mock.patch('time.time', return_value=bumped):
+            response = self.guest_client.get(page)
+            self.assertNotIn('Last-Modified', response)
+            Post.objects.create(text='Пост в ту же секунду', author=self.user)
+            response = self.guest_client.get(
+                page, HTTP_IF_MODIFIED_SINCE=http_date(int(bumped)))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Пост в ту же секунду')
+        with mock.patch('time.time', return_value=bumped + 2):
+            last_modified = self.guest_client.get(page)['Last-Modified']
+            response = self.guest_client.get(
+                page, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_relogin_changes_etag(self):
+        """После выхода и нового входа страница поста с формой
+        комментария не отвечает 304 со старым csrfmiddlewaretoken."""
+        page = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.get(page)
+        self.assertNotIn('Last-Modified', response)
+        self.authorized_client.logout()
+        self.authorized_client.force_login(self.user)
+        response = self.authorized_client.get(
+            page, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'csrfmiddlewaretoken')
+
+    def test_conditional_get_follows_comments_and_user(self):
+        """ETag страницы поста меняется от комментария, а ETag профиля -
+        от подписки текущего пользователя."""
+        post_page = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.guest_client.get(post_page)['ETag']
+        self.assertNotEqual(
+            self.authorized_client.get(post_page)['ETag'], etag)
+        Comment.objects.create(
+            post=self.post, author=self.user2, text='Комментарий')
+        response = self.guest_client.get(post_page, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        profile_page = reverse(
+            'posts:profile', kwargs={'username': self.user.username})
+        etag = self.authorized_client2.get(profile_page)['ETag']
+        Follow.objects.create(user=self.user2, author=self.user)
+        response = self.authorized_client2.get(
+            profile_page, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_post_card_cache_invalidated(self):
+        """Закэшированная карточка поста обновляется при правке поста,
+        имени автора и группы."""
+        page = self.PAGE_GROUP1
+        self.authorized_client.get(page)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = 'Исправленный текст'
+        post.save()
+        self.assertContains(
+            self.authorized_client.get(page), 'Исправленный текст')
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Новое'
+        user.last_name = 'Имя'
+        user.save()
+        self.assertContains(self.authorized_client.get(page), 'Новое Имя')
+        modified = Post.objects.get(pk=self.post.pk).modified
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Переименованная группа'
+        group.save()
+        self.assertGreater(
+            Post.objects.get(pk=self.post.pk).modified, modified)
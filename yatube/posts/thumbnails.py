@@ -0,0 +1,190 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from core.query_budget import not_counted
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore
+
+from .cache import bump_version, posts_pages
+from .models import Post
+from .storage import image_storage
+
+logger = logging.getLogger(__name__)
+
+# Все миниатюры, которые выводят шаблоны: (geometry, options).
+# Меняя {% thumbnail %} в шаблонах, обновите и этот список.
+THUMBNAILS = (
+    ('960x339', {'crop': 'center', 'upscale': True}),
+)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+class PregeneratedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который не сжимает изображения внутри запроса.
+
+    Готовая миниатюра берётся из key-value хранилища. Если её ещё нет,
+    создание ставится в пул потоков, а шаблон получает исходное
+    изображение.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, generate=False,
+                      **options):
+        if generate:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        if not file_:
+            raise ValueError('falsey file_ argument in get_thumbnail()')
+        source = ImageFile(file_)
+        cached = default.kvstore.get(
+            self.thumbnail(source, geometry_string, options))
+        if cached:
+            return cached
+        schedule(source.name)
+        return source
+
+    def thumbnail(self, source, geometry_string, options):
+        """ImageFile миниатюры без размеров, только для ключа хранилища."""
+        return ImageFile(
+            self.thumbnail_name(source, geometry_string, options),
+            default.storage,
+        )
+
+    def thumbnail_name(self, source, geometry_string, options):
+        """Имя файла миниатюры с теми же опциями, что и в sorl."""
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return self._get_thumbnail_filename(source, geometry_string, options)
+
+
+def _get_many(keys):
+    """Сырые значения key-value хранилища sorl для ключей keys.
+
+    Для cached_db хранилища - один get_many к кэшу и один запрос к БД
+    за промахами; остальные хранилища опрашиваются по одному ключу.
+    """
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(KVStore.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(
+            fetched, sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(fetched)
+    return {
+        key: None if value == EMPTY_VALUE else value
+        for key, value in values.items()
+    }
+
+
+def preload_thumbnails(posts, geometry='960x339'):
+    """Заполняет post.thumbnail у всех постов с картинкой одним
+    обращением к key-value хранилищу sorl.
+
+    Пока миниатюра не готова, в post.thumbnail лежит исходное
+    изображение, а создание миниатюры ставится в очередь.
+    """
+    options = dict(THUMBNAILS)[geometry]
+    backend = PregeneratedThumbnailBackend()
+    posts = [post for post in posts if post.image]
+    keys = {}
+    for post in posts:
+        thumbnail = backend.thumbnail(
+            ImageFile(post.image), geometry, options)
+        keys[post.pk] = add_prefix(thumbnail.key)
+    values = _get_many(list(set(keys.values())))
+    for post in posts:
+        value = values.get(keys[post.pk])
+        if value:
+            post.thumbnail = deserialize_image_file(value)
+        else:
+            post.thumbnail = ImageFile(post.image)
+            schedule(post.image.name)
+    return posts
+
+
+def generate_thumbnails(name):
+    """Создаёт все миниатюры из THUMBNAILS для изображения name.
+
+    Если появилась хотя бы одна новая миниатюра, сбрасываются
+    закэшированные страницы постов с этим изображением и лент с их
+    карточками.
+    """
+    backend = PregeneratedThumbnailBackend()
+    source = ImageFile(name, image_storage)
+    created = False
+    for geometry, options in THUMBNAILS:
+        if default.kvstore.get(backend.thumbnail(source, geometry, options)):
+            continue
+        backend.get_thumbnail(source, geometry, generate=True, **options)
+        created = True
+    if created:
+        bump_version(*posts_pages(Post.objects.filter(image=name)))
+
+
+def run_in_background(lock, func, *args):
+    """Выполняет func(*args) в пуле потоков после коммита транзакции.
+
+    Пока задача с тем же lock выполняется, повторные вызовы
+    игнорируются. При settings.THUMBNAIL_WORKERS = 0 задача выполняется
+    сразу после коммита в текущем потоке.
+    """
+    def work():
+        try:
+            func(*args)
+        except Exception:
+            logger.exception('Фоновая задача %s завершилась ошибкой', lock)
+        finally:
+            cache.delete(lock)
+
+    def work_in_thread():
+        try:
+            work()
+        finally:
+            connection.close()
+
+    def submit():
+        if not cache.add(lock, 1, 60 * 5):
+            return
+        if settings.THUMBNAIL_WORKERS:
+            get_executor().submit(work_in_thread)
+        else:
+            with not_counted():
+                work()
+    transaction.on_commit(submit)
+
+
+def schedule(name):
+    """Ставит создание миниатюр изображения name в пул."""
+    run_in_background(f'thumbnails:{name}', generate_thumbnails, name)
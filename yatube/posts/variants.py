@@ -0,0 +1,124 @@
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import bump_version, posts_pages
+from .models import ImageVariant, Post
+from .storage import sharded_name
+from .thumbnails import run_in_background
+
+# Кадр карточки поста: те же пропорции, что у миниатюры 960x339.
+FRAME = (960, 339)
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True,
+             'progressive': True},
+}
+
+
+def variant_widths(source_width):
+    """Ширины вариантов, не превышающие исходную (хотя бы одна)."""
+    widths = sorted(settings.IMAGE_VARIANT_WIDTHS)
+    return [width for width in widths if width <= source_width] or widths[:1]
+
+
+def variant_name(source, width, image_format):
+    """Имя файла варианта, общее для всех постов с картинкой source."""
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return sharded_name(
+        'posts/variants', f'{stem}-{width}.{image_format}', key=stem)
+
+
+def delete_files(source):
+    """Удаляет файлы всех вариантов картинки source."""
+    storage = ImageVariant._meta.get_field('file').storage
+    for width in settings.IMAGE_VARIANT_WIDTHS:
+        for image_format in settings.IMAGE_VARIANT_FORMATS:
+            storage.delete(variant_name(source, width, image_format))
+
+
+def build_variants(post_id):
+    """Кодирует картинку поста во все ширины и форматы из настроек.
+
+    Варианты уже загруженной картинки повторно не создаются, а файлы,
+    закодированные для другого поста с той же картинкой, используются
+    повторно. После замены вариантов пост помечается изменённым, чтобы
+    карточки и страницы перерисовались с srcset.
+    """
+    post = Post.objects.filter(pk=post_id).only('pk', 'image').first()
+    if post is None or not post.image:
+        return
+    old = list(post.image_variants.all())
+    if old and all(variant.source == post.image.name for variant in old):
+        return
+    source = post.image.name
+    storage = ImageVariant._meta.get_field('file').storage
+    with post.image.open('rb') as file:
+        image = Image.open(file)
+        names = {
+            (width, image_format): variant_name(source, width, image_format)
+            for width in variant_widths(image.width)
+            for image_format in settings.IMAGE_VARIANT_FORMATS
+        }
+        missing = {key for key, name in names.items()
+                   if not storage.exists(name)}
+        if missing:
+            image.load()
+    if missing:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+    frames = {}
+    variants = []
+    for (width, image_format), name in names.items():
+        height = round(width * FRAME[1] / FRAME[0])
+        if (width, image_format) in missing:
+            if width not in frames:
+                frames[width] = ImageOps.fit(
+                    image, (width, height), Image.LANCZOS)
+            buffer = io.BytesIO()
+            frames[width].save(buffer, **SAVE_OPTIONS[image_format])
+            name = storage.save(name, ContentFile(buffer.getvalue()))
+        variants.append(ImageVariant(
+            post=post, source=source, file=name, format=image_format,
+            width=width, height=height,
+        ))
+    with transaction.atomic():
+        ImageVariant.objects.filter(post=post).delete()
+        ImageVariant.objects.bulk_create(variants)
+        Post.objects.filter(pk=post.pk).update(modified=timezone.now())
+    bump_version(*posts_pages(Post.objects.filter(pk=post.pk)))
+
+
+def schedule(post):
+    """Ставит создание вариантов картинки post в пул."""
+    run_in_background(
+        f'variants:{post.pk}:{post.image.name}', build_variants, post.pk)
+
+
+def srcsets(post):
+    """[(MIME-тип, srcset)] по записанным вариантам текущей картинки."""
+    by_format = {}
+    for variant in post.image_variants.all():
+        if variant.source == post.image.name:
+            by_format.setdefault(variant.format, []).append(
+                f'{variant.file.url} {variant.width}w')
+    return [
+        (f'image/{image_format}', ', '.join(by_format[image_format]))
+        for image_format in settings.IMAGE_VARIANT_FORMATS
+        if image_format in by_format
+    ]
+
+
+def preload_srcsets(posts):
+    """Заполняет post.srcsets у постов с картинкой одним запросом."""
+    posts = [post for post in posts if post.image]
+    prefetch_related_objects(posts, 'image_variants')
+    for post in posts:
+        post.srcsets = srcsets(post)
+    return posts
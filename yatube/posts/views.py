@@ -1,40 +1,102 @@
+from core.query_budget import query_budget
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.urls import reverse
+from django.utils.http import urlencode
 
+from .autocomplete import USER, get_index
+from .cache import (INDEX_PAGE, conditional_page, group_page, post_page,
+                    profile_page, versioned_cache_page)
+from .feed import follow_feed
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User
+from .models import Comment, Group, Post, User
+from .paginators import (CommentCursorPaginator, CountedPaginator,
+                         CursorPaginator)
+from .search import SearchResults
+from .thumbnails import preload_thumbnails
+from .variants import preload_srcsets
 
 
-def get_page_obj(request, *args):
-    """Получение объекта page_obj для пагинатора."""
-    paginator = Paginator(*args, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+def get_page_obj(request, *args, cursor=None, count=None):
+    """Получение объекта page_obj для пагинатора.
+
+    При cursor=True (по умолчанию - settings.CURSOR_PAGINATION) лента
+    листается по непрозрачному ?cursor= без OFFSET и COUNT. Известное
+    заранее количество постов count избавляет от запроса COUNT.
+    Миниатюры и варианты картинок всех постов страницы загружаются
+    одним обращением (post.thumbnail, post.srcsets).
+    """
+    if cursor is None:
+        cursor = settings.CURSOR_PAGINATION
+    if cursor:
+        paginator = CursorPaginator(*args, settings.POSTS_PER_PAGE)
+        page_obj = paginator.get_page(request.GET.get('cursor'))
+    else:
+        paginator = CountedPaginator(
+            *args, settings.POSTS_PER_PAGE, count=count)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    preload_thumbnails(page_obj)
+    preload_srcsets(page_obj)
     return page_obj
 
 
-@cache_page(20, key_prefix='index_page')
+def get_comments_page(post_id, cursor=None):
+    """Порция комментариев поста: первая или следующая за cursor."""
+    paginator = CommentCursorPaginator(
+        Comment.objects.filter(post_id=post_id).select_related('author'),
+        settings.COMMENTS_PER_PAGE,
+    )
+    return paginator.get_page(cursor)
+
+
+def get_reply_parent(post, parent_id):
+    """Комментарий того же поста, на который отвечают, или None."""
+    if not parent_id or not parent_id.isdigit():
+        return None
+    return Comment.objects.filter(post=post, pk=parent_id).only(
+        'pk', 'path').first()
+
+
+def post_detail_pages(post_id):
+    """Страницы, от которых зависит страница поста: сам пост и счётчик
+    постов его автора (меняется вместе со страницей профиля)."""
+    prefixes = [post_page(post_id)]
+    prefixes.extend(
+        profile_page(username) for username in Post.objects.filter(
+            pk=post_id).values_list('author__username', flat=True))
+    return prefixes
+
+
+@query_budget(7)
+@conditional_page(INDEX_PAGE, feed=True)
+@versioned_cache_page(settings.INDEX_CACHE_TIMEOUT, key_prefix=INDEX_PAGE)
 def index(request):
     """Стартовая страница проекта, выводятся все посты без фильтрации,
     посты представлены в краткой версии."""
     template = 'posts/index.html'
     page_obj = get_page_obj(request, Post.objects.all().select_related(
-        'author', 'group'))
+        'author', 'group', 'last_commenter'))
     context = {
         'page_obj': page_obj,
     }
     return render(request, template, context=context)
 
 
+@query_budget(7)
+@conditional_page(group_page, feed=True)
+@versioned_cache_page(
+    settings.PAGE_CACHE_TIMEOUT, key_prefix=group_page, per_user=False)
 def group_posts(request, slug):
     """Вывод постов по группам, применена пагинация по 10."""
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
-    page_obj = get_page_obj(request, group.posts.all().select_related('author')
-                            )
+    page_obj = get_page_obj(
+        request, group.posts.all().select_related('author', 'last_commenter'),
+        count=group.posts_count,
+    )
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -42,30 +104,31 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@query_budget(8)
+@conditional_page(profile_page, feed=True)
+@versioned_cache_page(
+    settings.PAGE_CACHE_TIMEOUT, key_prefix=profile_page, per_user=False)
 def profile(request, username):
     """Профайл автора со всеми его постами."""
-    author = get_object_or_404(User, username=username)
-    page_obj = get_page_obj(request, author.posts.all().select_related(
-        'group'))
-    if request.user.is_authenticated:
-        return render(
-            request, 'posts/profile.html',
-            {'page_obj': page_obj,
-             'author': author,
-             'following': author.following.filter(user=request.user).exists(),
-             }
-        )
-    else:
-        return render(
-            request, 'posts/profile.html',
-            {
-                'page_obj': page_obj,
-                'author': author,
-            }
-        )
+    author = get_object_or_404(
+        User.objects.select_related('profile'), username=username)
+    page_obj = get_page_obj(
+        request, author.posts.all().select_related(
+            'author', 'group', 'last_commenter'),
+        count=author.profile.posts_count,
+    )
+    return render(
+        request, 'posts/profile.html',
+        {
+            'page_obj': page_obj,
+            'author': author,
+        }
+    )
 
 
+@query_budget(20)
 @login_required
+@transaction.atomic
 def post_create(request):
     """Функция обработки формы для создания нового поста."""
     form = PostForm(
@@ -80,7 +143,9 @@ def post_create(request):
     return render(request, 'posts/create_post.html', {'form': form})
 
 
+@query_budget(20)
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     """Функция обработки формы для редактирования поста автора."""
     post = get_object_or_404(Post, pk=post_id)
@@ -103,10 +168,17 @@ def post_edit(request, post_id):
         return redirect('posts:post_detail', post_id=post_id)
 
 
+@query_budget(8)
+@conditional_page(post_detail_pages)
+@versioned_cache_page(
+    settings.PAGE_CACHE_TIMEOUT, key_prefix=post_page, per_user=False)
 def post_detail(request, post_id):
     """Вывод полной версии поста."""
-    post = get_object_or_404(Post, pk=post_id)
-    comments = post.comments.all().select_related('author')
+    post = get_object_or_404(
+        Post.objects.select_related('author__profile', 'group'), pk=post_id)
+    preload_thumbnails([post])
+    preload_srcsets([post])
+    comments = get_comments_page(post.pk)
     form = CommentForm()
     context = {
         'post': post,
@@ -116,26 +188,100 @@ def post_detail(request, post_id):
     return render(request, 'posts/post_detail.html', context)
 
 
+@query_budget(5)
+@conditional_page(post_page)
+@versioned_cache_page(
+    settings.PAGE_CACHE_TIMEOUT, key_prefix=post_page, per_user=False)
+def post_comments(request, post_id):
+    """Следующие комментарии поста по ?cursor=.
+
+    С ?partial=1 (подгрузка со страницы поста) отдаёт только список.
+    """
+    post = get_object_or_404(Post.objects.only('pk', 'text'), pk=post_id)
+    comments = get_comments_page(post.pk, request.GET.get('cursor'))
+    template = ('posts/includes/comments.html' if request.GET.get('partial')
+                else 'posts/comments.html')
+    return render(request, template, {'post': post, 'comments': comments})
+
+
+@query_budget(2)
+def autocomplete(request):
+    """Пользователи и группы, чьё имя, slug или название начинается с ?q=.
+
+    Отвечает из индекса в памяти процесса, без запросов к БД: индекс
+    строится при запуске (yatube/wsgi.py). Два запроса бюджета -
+    перестроение индекса после потери журнала изменений.
+    """
+    query = request.GET.get('q', '').strip()
+    results = []
+    if query:
+        for kind, value, label in get_index().search(
+                query, settings.AUTOCOMPLETE_LIMIT):
+            view_name = ('posts:profile' if kind == USER
+                         else 'posts:group_list')
+            results.append({
+                'type': kind,
+                'value': value,
+                'label': label,
+                'url': reverse(view_name, args=[value]),
+            })
+    return JsonResponse({'results': results})
+
+
+@query_budget(6)
+def search(request):
+    """Поиск по текстам постов и комментариев, от более релевантных."""
+    query = request.GET.get('q', '').strip()
+    page_obj = get_page_obj(
+        request,
+        SearchResults(query, Post.objects.select_related(
+            'author', 'group', 'last_commenter')),
+        cursor=False,
+    )
+    context = {
+        'page_obj': page_obj,
+        'query': query,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@query_budget(12)
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
-    """Функция комментирования постов авторов."""
+    """Функция комментирования постов авторов.
+
+    На AJAX-запрос отвечает только разметкой нового комментария (или
+    ошибками формы в JSON), без перехода на страницу поста.
+    """
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        comment.parent = get_reply_parent(post, request.POST.get('parent'))
         comment.save()
+        if request.is_ajax():
+            return render(
+                request, 'posts/includes/comment.html',
+                {'comment': comment}, status=201,
+            )
         return redirect('posts:post_detail', post_id=post_id)
+    if request.is_ajax() and request.method == 'POST':
+        return JsonResponse({'errors': form.errors}, status=400)
     return render(request, 'posts/add_comment.html', {'form': form})
 
 
+@query_budget(7)
 @login_required
+@conditional_page(INDEX_PAGE, feed=True)
 def follow_index(request):
     """Вывод постов авторов по подписке."""
     page_obj = get_page_obj(
-        request, Post.objects.filter(
-            author__following__user=request.user).select_related('group')
+        request, follow_feed(request.user).select_related(
+            'author', 'group', 'last_commenter')
     )
     context = {
         'page_obj': page_obj,
@@ -143,7 +289,9 @@ def follow_index(request):
     return render(request, 'posts/follow.html', context)
 
 
+@query_budget(25)
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     """Подписаться на автора."""
     author = get_object_or_404(User, username=username)
@@ -155,7 +303,9 @@ def profile_follow(request, username):
         return redirect('posts:profile', username)
 
 
+@query_budget(13)
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     """Отписаться от автора."""
     author = get_object_or_404(User, username=username)
@@ -0,0 +1,29 @@
+// Подсказывает пользователей и группы по первым буквам в поле поиска.
+document.querySelectorAll('[data-autocomplete]').forEach(function (input) {
+  var list = document.querySelector(input.dataset.autocomplete);
+  var timer = null;
+  input.addEventListener('input', function () {
+    clearTimeout(timer);
+    timer = setTimeout(function () {
+      var query = input.value.trim();
+      if (!query) {
+        list.replaceChildren();
+        return;
+      }
+      fetch(input.dataset.autocompleteUrl + '?q=' + encodeURIComponent(query))
+        .then(function (response) {
+          return response.json();
+        })
+        .then(function (data) {
+          list.replaceChildren.apply(list, data.results.map(function (item) {
+            var link = document.createElement('a');
+            link.href = item.url;
+            link.className = 'list-group-item list-group-item-action';
+            link.textContent = (item.type === 'user' ? '@' : '#')
+              + item.value + ' - ' + item.label;
+            return link;
+          }));
+        });
+    }, 150);
+  });
+});
@@ -0,0 +1,90 @@
+// Подгружает следующие комментарии вместо перехода по ссылке.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-more-comments]');
+  if (!link) {
+    return;
+  }
+  event.preventDefault();
+  fetch(link.href + '&partial=1')
+    .then(function (response) {
+      return response.text();
+    })
+    .then(function (html) {
+      var loaded = document.createElement('template');
+      loaded.innerHTML = html;
+      // Свои комментарии, отправленные без перезагрузки, уже на странице.
+      loaded.content.querySelectorAll('[id^="comment-"]').forEach(
+        function (comment) {
+          if (document.getElementById(comment.id)) {
+            comment.remove();
+          }
+        });
+      link.after(loaded.content);
+      link.remove();
+    });
+});
+
+// Ответ на комментарий: форма запоминает, на какой комментарий отвечают.
+document.addEventListener('click', function (event) {
+  var link = event.target.closest('[data-reply-to]');
+  var form = document.querySelector('#comment-form form');
+  if (!link || !form) {
+    return;
+  }
+  event.preventDefault();
+  form.elements.parent.value = link.dataset.replyTo;
+  form.elements.text.focus();
+});
+
+// Вставляет новый комментарий в конец ветки родителя или всего списка.
+function insertComment(list, parentId, html) {
+  var anchor = parentId && document.getElementById('comment-' + parentId);
+  if (!anchor) {
+    list.insertAdjacentHTML('beforeend', html);
+    return;
+  }
+  var depth = Number(anchor.dataset.depth);
+  while (anchor.nextElementSibling
+         && Number(anchor.nextElementSibling.dataset.depth) > depth) {
+    anchor = anchor.nextElementSibling;
+  }
+  anchor.insertAdjacentHTML('afterend', html);
+}
+
+// Отправляет комментарий без перезагрузки страницы: сервер отвечает
+// только разметкой нового комментария. При любой неудаче форма
+// отправляется обычным образом.
+document.addEventListener('submit', function (event) {
+  var form = event.target.closest('#comment-form form');
+  var list = document.querySelector('[data-comments]');
+  if (!form || !list || !window.fetch) {
+    return;
+  }
+  event.preventDefault();
+  var errors = form.querySelector('[data-comment-errors]');
+  fetch(form.action, {
+    method: 'POST',
+    body: new FormData(form),
+    credentials: 'same-origin',
+    headers: {'X-Requested-With': 'XMLHttpRequest'},
+  })
+    .then(function (response) {
+      if (response.status === 201) {
+        return response.text().then(function (html) {
+          insertComment(list, form.elements.parent.value, html);
+          form.reset();
+          form.elements.parent.value = '';
+          errors.textContent = '';
+        });
+      }
+      if (response.status === 400) {
+        return response.json().then(function (data) {
+          errors.textContent = Object.values(data.errors).join(' ');
+        });
+      }
+      form.submit();
+    })
+    .catch(function () {
+      form.submit();
+    });
+});
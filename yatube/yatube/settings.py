@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -127,6 +128,19 @@ STATIC_URL = '/static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Файлы отдаёт core.views.serve_media; с заголовком 'X-Accel-Redirect'
+# (nginx, internal-location MEDIA_ACCEL_PREFIX) или 'X-Sendfile' тело
+# передаёт фронт-сервер
+MEDIA_SENDFILE_HEADER = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+# Имена, выведенные из содержимого (картинки и их варианты по SHA-256,
+# миниатюры sorl по ключу такой картинки): кэшируются как immutable на
+# MEDIA_CACHE_MAX_AGE, остальные файлы проверяются при каждом обращении
+MEDIA_IMMUTABLE_PATTERN = (
+    r'^(posts/(variants/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(-\d+)?'
+    r'|cache/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32})\.\w+$'
+)
 
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:home'
@@ -170,9 +184,68 @@ if DEBUG:
 
 # EnvVariables
 POSTS_PER_PAGE = 10
-
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Комментарии на странице поста, остальные подгружаются по курсору
+COMMENTS_PER_PAGE = 20
+# Курсорная пагинация лент по (pub_date, id) вместо ?page=
+CURSOR_PAGINATION = False
+# Списки админки: отфильтрованные строки считаются не дальше этого числа,
+# размер всей таблицы без фильтров берётся из статистики планировщика
+# (sqlite_stat1, pg_class, information_schema)
+ADMIN_COUNT_LIMIT = 10000
+# Подсказок пользователей и групп на один запрос автодополнения
+AUTOCOMPLETE_LIMIT = 10
+# Посты авторов с большим числом подписчиков не раздаются по лентам
+# при записи, а подмешиваются в ленту подписок при чтении. Раздача
+# возобновляется ниже второго порога, чтобы режим не переключался
+# подписками и отписками у первого
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+FEED_FANOUT_RESUME_FOLLOWERS = 800
+FEED_BATCH_SIZE = 500
+# Версии страниц (bump_version), журнал автодополнения и блокировки
+# фоновых задач живут в кэше и должны быть общими для всех процессов:
+# в продакшене задайте CACHE_LOCATION (memcached, host:port). Без него
+# у каждого процесса свой LocMemCache, сброс версии видит только
+# процесс, обработавший запись, поэтому страницы кэшируются ненадолго
+CACHE_LOCATION = os.getenv('CACHE_LOCATION')
+if CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': CACHE_LOCATION,
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Главная страница сбрасывается при изменении постов, таймаут - страховка
+INDEX_CACHE_TIMEOUT = 60 * 60 * 6 if CACHE_LOCATION else 60
+# Сколько секунд один запрос может пересобирать страницу кэша
+PAGE_CACHE_LOCK_TIMEOUT = 10
+# Кэшировать главную, группы, профили и посты одной копией на всех
+# пользователей, подставляя личные фрагменты после чтения из кэша
+SHARED_PAGE_CACHE = False
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6 if CACHE_LOCATION else 60
+# Превышение бюджета запросов view (@query_budget) и N+1: в разработке и
+# тестах - исключение, в продакшене - предупреждение в лог
+QUERY_BUDGET_RAISE = DEBUG
+QUERY_BUDGET_MAX_REPEATS = 3
+
+# Миниатюры создаются пулом потоков после загрузки, а не в запросе;
+# в режиме отладки (и в тестах) - сразу после коммита, без пула
+THUMBNAIL_BACKEND = 'posts.thumbnails.PregeneratedThumbnailBackend'
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+# Варианты картинки поста для srcset: ширины и форматы в порядке выбора
+IMAGE_VARIANT_WIDTHS = (480, 960, 1440)
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+
+# Загрузки пишутся во временный файл по частям, картинка проверяется
+# по заголовку без декодирования. Файл больше UPLOAD_MAX_SIZE
+# отбрасывается с ошибкой формы, но тело запроса дочитывается: верхний
+# предел тела задаёт фронт-сервер (client_max_body_size в nginx)
+FILE_UPLOAD_HANDLERS = ['core.uploads.BoundedUploadHandler']
+UPLOAD_MAX_SIZE = 10 * 1024 * 1024
+IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+# Индекс автодополнения строится до первого запроса к процессу.
+from posts.autocomplete import warm  # noqa: E402
+
+warm()